@@ -0,0 +1,153 @@
+"""
+Бенчмарки горячих путей.
+
+    python -m benchmarks --output results.json
+    python -m benchmarks --suites fanout --clients 2000 --baseline results.json
+
+JSON с результатами пишется в --output (или в stdout), журнал приложения и
+сравнение с --baseline — в stderr. Набор sync пишет в БД из настроек
+приложения (.env) и пропускается, если она недоступна; NATS по умолчанию
+заменяется внутрипроцессной заглушкой (--nats — настоящий сервер NATS_URL).
+"""
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional
+
+SUITES = ("parser", "sync", "fanout")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(data: dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def _compare(baseline: dict, current: dict):
+    old = _flatten(baseline.get("results", {}))
+    new = _flatten(current.get("results", {}))
+    print(f"\nCompared with {baseline.get('meta', {}).get('commit') or 'baseline'}:", file=sys.stderr)
+    for name in sorted(old.keys() & new.keys()):
+        change = f"{(new[name] - old[name]) / old[name] * 100:+.1f}%" if old[name] else "n/a"
+        print(f"  {name:<50} {old[name]:>14} -> {new[name]:>14}  {change}", file=sys.stderr)
+
+
+async def run(args) -> dict:
+    from core.config import settings
+    from service import nats_client as nats_module
+    from service.nats_client import nats_client
+    from service.parser_service import shutdown_parser_pool
+    from benchmarks.fakes import FakeNATS
+    from benchmarks.stub_server import StubCatalogServer, generate_pages, load_fixtures
+    from benchmarks import suites
+
+    pages = load_fixtures(args.fixtures) if args.fixtures else []
+    if not pages:
+        pages = generate_pages(args.pages, args.products_per_page)
+
+    if not args.nats:
+        nats_module.NATS = FakeNATS
+    await nats_client.connect()
+
+    server = StubCatalogServer(pages)
+    await server.start()
+    results = {}
+    try:
+        if "parser" in args.suites:
+            results["parser"] = await suites.bench_parser(server, repeat=args.repeat)
+        if "sync" in args.suites:
+            results["sync"] = await suites.bench_sync(server, cycles=args.cycles, change_fraction=args.change_fraction)
+        if "fanout" in args.suites:
+            results["fanout"] = await suites.bench_fanout(
+                clients=args.clients, messages=args.messages, batch_size=args.batch_size,
+                msgpack_share=args.msgpack_share, subscribed_share=args.subscribed_share
+            )
+    finally:
+        await server.stop()
+        shutdown_parser_pool()
+        await nats_client.disconnect()
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "nats": "server" if args.nats else "fake",
+            "fixtures": str(args.fixtures) if args.fixtures else "generated",
+            "settings": {
+                "PARSER_BACKEND": settings.PARSER_BACKEND,
+                "PARSER_PROCESS_WORKERS": settings.PARSER_PROCESS_WORKERS,
+                "PARSER_CONCURRENCY": settings.PARSER_CONCURRENCY,
+                "DB_SYNC_CHUNK_SIZE": settings.DB_SYNC_CHUNK_SIZE,
+                "PRODUCT_INDEX_ENABLED": settings.PRODUCT_INDEX_ENABLED,
+                "EVENT_COALESCE_WINDOW_MS": settings.EVENT_COALESCE_WINDOW_MS,
+                "WS_SEND_QUEUE_SIZE": settings.WS_SEND_QUEUE_SIZE,
+                "NATS_BATCH_SIZE": settings.NATS_BATCH_SIZE
+            }
+        },
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "fixtures")},
+        "results": results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmarks for parser, sync and fan-out")
+    parser.add_argument("--suites", default=",".join(SUITES),
+                        type=lambda value: [name for name in value.split(",") if name],
+                        help=f"Comma-separated subset of {', '.join(SUITES)}")
+    parser.add_argument("--fixtures", type=Path, help="Directory with recorded listing pages page-N.html")
+    parser.add_argument("--pages", type=int, default=20, help="Generated pages when no fixtures are given")
+    parser.add_argument("--products-per-page", type=int, default=48)
+    parser.add_argument("--repeat", type=int, default=3, help="Parser runs; the fastest is reported")
+    parser.add_argument("--cycles", type=int, default=3, help="Sync cycles: one cold, the rest incremental")
+    parser.add_argument("--change-fraction", type=float, default=0.1, help="Share of prices changed per sync cycle")
+    parser.add_argument("--clients", type=int, default=500, help="Simulated WebSocket clients")
+    parser.add_argument("--messages", type=int, default=200, help="Broadcast messages")
+    parser.add_argument("--batch-size", type=int, default=20, help="Products per broadcast message")
+    parser.add_argument("--msgpack-share", type=float, default=0.5, help="Share of clients using msgpack")
+    parser.add_argument("--subscribed-share", type=float, default=0.3, help="Share of clients with a filter")
+    parser.add_argument("--nats", action="store_true", help="Publish to the NATS server from NATS_URL")
+    parser.add_argument("--output", type=Path, help="Write JSON results here instead of stdout")
+    parser.add_argument("--baseline", type=Path, help="Previous results to compare with")
+    args = parser.parse_args()
+
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+
+    with redirect_stdout(sys.stderr):
+        report = asyncio.run(run(args))
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+
+    if args.baseline:
+        _compare(json.loads(args.baseline.read_text(encoding="utf-8")), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Внутрипроцессные замены внешних систем для бенчмарков.
+
+FakeNATS подменяет клиент nats-py: NATSClient работает как обычно (очередь,
+пачки, flush), но сообщения никуда не уходят. FakeWebSocket записывает время
+и содержимое каждого отправленного кадра.
+"""
+import time
+from typing import List, Tuple, Union
+
+
+class FakeNATS:
+    def __init__(self):
+        self.is_connected = False
+        self.published = 0
+        self.published_bytes = 0
+        self.flushes = 0
+
+    async def connect(self, servers=None, **kwargs):
+        self.is_connected = True
+
+    async def publish(self, subject: str, payload: bytes = b"", **kwargs):
+        self.published += 1
+        self.published_bytes += len(payload)
+
+    async def flush(self, timeout: float = 10):
+        self.flushes += 1
+
+    async def subscribe(self, subject: str, queue: str = "", cb=None, **kwargs):
+        return None
+
+    async def drain(self):
+        self.is_connected = False
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames: List[Tuple[float, Union[str, bytes]]] = []
+
+    async def accept(self, *args, **kwargs):
+        pass
+
+    async def send_text(self, data: str):
+        self.frames.append((time.perf_counter(), data))
+
+    async def send_bytes(self, data: bytes):
+        self.frames.append((time.perf_counter(), data))
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
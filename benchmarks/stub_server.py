@@ -0,0 +1,166 @@
+"""
+Локальная заглушка каталога для бенчмарков: отдаёт страницы листинга
+в разметке best-magazin.com по адресу /catalog?page=N.
+
+Если в каталоге fixtures лежат записанные страницы (page-1.html, page-2.html, ...),
+отдаются они; иначе страницы генерируются по той же разметке. Ответы без ETag
+и Last-Modified, поэтому «не изменилась ли страница» решает хэш карточек —
+как для сайта, который не отдаёт валидаторы.
+"""
+import asyncio
+import random
+import re
+from pathlib import Path
+from typing import List, Optional
+from urllib.parse import urlsplit, parse_qsl
+
+CATALOG_PATH = "/catalog"
+
+_PRICE_RE = re.compile(r'(itemprop="price" content=")(\d+(?:\.\d+)?)(")')
+_FIXTURE_RE = re.compile(r'page-(\d+)\.html$')
+
+_NAMES = (
+    "Смартфон Apple iPhone 15 Pro Max 256 ГБ, титановый синий, официальная гарантия",
+    "Смартфон Apple iPhone 15 128 ГБ, розовый, восстановленный производителем",
+    "Смартфон Apple iPhone 14 Plus 512 ГБ, фиолетовый, две nano-SIM",
+    "Смартфон Apple iPhone 13 mini 256 ГБ, тёмная ночь, eSIM",
+    "Смартфон Apple iPhone SE (3-го поколения) 64 ГБ, красный (PRODUCT)RED",
+)
+
+
+def _rub(value: int) -> str:
+    return f"{value:,} ₽".replace(",", " ")
+
+
+def _card(product_id: int, rng: random.Random) -> str:
+    name = f"{rng.choice(_NAMES)} #{product_id}"
+    price = rng.randrange(20_000, 250_000, 10)
+    old_price = ''
+    if rng.random() < 0.3:
+        old_price = f'<span class="price-old">{_rub(int(price * 1.15))}</span>'
+    buy_button = '<div class="cart"><a href="#">Купить</a></div>' if rng.random() < 0.9 else ''
+    return f'''
+<div class="product-layout product-grid col-lg-3 col-md-4 col-sm-6 col-xs-12">
+  <div class="product-thumb">
+    <div class="image"><a href="/apple/iphone/product-{product_id}">
+      <img src="/image/cache/catalog/iphone/{product_id}-228x228.jpg" itemprop="image" alt="{name}" class="img-responsive"/>
+    </a></div>
+    <div class="caption">
+      <h4><a href="/apple/iphone/product-{product_id}"><span itemprop="name">{name}</span></a></h4>
+      <div class="price" itemprop="offers" itemscope itemtype="http://schema.org/Offer">
+        <meta itemprop="price" content="{price}"/>
+        <meta itemprop="priceCurrency" content="RUB"/>
+        <span class="price-new">{_rub(price)}</span>{old_price}
+      </div>
+    </div>
+    {buy_button}
+  </div>
+</div>'''
+
+
+def generate_pages(pages: int, products_per_page: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    result = []
+    for page in range(1, pages + 1):
+        first_id = (page - 1) * products_per_page + 1
+        cards = ''.join(_card(product_id, rng) for product_id in range(first_id, first_id + products_per_page))
+        links = ''.join(
+            f'<li><a href="{CATALOG_PATH}?page={number}">{number}</a></li>'
+            for number in range(1, pages + 1) if number != page
+        )
+        result.append(f'''<!DOCTYPE html>
+<html lang="ru"><head><meta charset="UTF-8"/><title>iPhone — страница {page}</title></head>
+<body>
+<header><nav class="menu">Каталог · Доставка · Контакты</nav></header>
+<div id="content" class="col-sm-12"><div class="row">{cards}
+</div>
+<div class="row"><div class="col-sm-6 text-left"><ul class="pagination">{links}</ul></div>
+<div class="col-sm-6 text-right">Показано с {first_id} по {first_id + products_per_page - 1} (всего {pages} страниц)</div></div>
+</div>
+<footer>© Интернет-магазин</footer>
+</body></html>''')
+    return result
+
+
+def load_fixtures(directory: Path) -> List[str]:
+    files = sorted(
+        (int(match.group(1)), path) for path in directory.glob("page-*.html")
+        if (match := _FIXTURE_RE.search(path.name))
+    )
+    return [path.read_text(encoding="utf-8") for _, path in files]
+
+
+class StubCatalogServer:
+    """
+    Минимальный HTTP/1.1 сервер с keep-alive на asyncio: httpx-клиент парсера
+    работает с ним так же, как с сайтом, включая пул соединений.
+    """
+
+    def __init__(self, pages: List[str], host: str = "127.0.0.1", port: int = 0):
+        self.pages = list(pages)
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def catalog_url(self) -> str:
+        return f"http://{self.host}:{self.port}{CATALOG_PATH}"
+
+    @property
+    def product_count(self) -> int:
+        return sum(html.count('class="product-layout') for html in self.pages)
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def mutate(self, fraction: float, seed: int = 0) -> int:
+        """Меняет цену у доли карточек, как если бы магазин обновил каталог; возвращает число изменений."""
+        rng = random.Random(seed)
+        changed = 0
+
+        def bump(match):
+            nonlocal changed
+            if rng.random() >= fraction:
+                return match.group(0)
+            changed += 1
+            price = float(match.group(2)) + rng.choice((-1, 1)) * rng.randrange(10, 1000, 10)
+            return f"{match.group(1)}{max(price, 10):.0f}{match.group(3)}"
+
+        self.pages = [_PRICE_RE.sub(bump, html) for html in self.pages]
+        return changed
+
+    def _response(self, target: str) -> bytes:
+        parts = urlsplit(target)
+        page = int(dict(parse_qsl(parts.query)).get("page", 1))
+        if parts.path != CATALOG_PATH or not 1 <= page <= len(self.pages):
+            body, status = b"Not Found", "404 Not Found"
+        else:
+            body, status = self.pages[page - 1].encode("utf-8"), "200 OK"
+        head = (
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/html; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: keep-alive\r\n\r\n"
+        )
+        return head.encode("latin-1") + body
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await reader.readuntil(b"\r\n\r\n")
+                _, target, _ = request.split(b"\r\n", 1)[0].decode("latin-1").split(" ", 2)
+                self.requests += 1
+                writer.write(self._response(target))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,293 @@
+"""
+Замеры горячих путей: разбор и обход страниц, цикл синхронизации фонового
+обхода и рассылка по WebSocket. Каждая функция возвращает словарь с
+числовыми результатами, готовый к записи в JSON.
+"""
+import asyncio
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+import httpx
+import msgpack
+from sqlalchemy import delete, event
+from core.config import settings
+from core.database import engine, Base, AsyncSessionLocal, upgrade_schema
+from models.product import Product
+from service.background_tasks import _crawl_page
+from service.event_coalescer import event_coalescer
+from service.parser_service import iter_product_pages, create_http_client, reset_page_cache
+from service.product_extractor import extract_page
+from service.product_index import product_index
+from service.sources import ParserSource
+from service.websocket_manager import ConnectionManager
+from benchmarks.fakes import FakeWebSocket
+from benchmarks.stub_server import StubCatalogServer
+
+BENCH_SOURCE = "benchmark"
+# Постоянный адрес товаров: URL в БД не зависят от порта заглушки
+BENCH_BASE_URL = "https://benchmark.local"
+FANOUT_SOURCES = ("benchmark-a", "benchmark-b", "benchmark-c")
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value * 1000, 3)
+
+
+def _rate(count: float, elapsed: float) -> float:
+    return round(count / elapsed, 1) if elapsed > 0 else 0.0
+
+
+def _bench_source(server: StubCatalogServer) -> ParserSource:
+    return ParserSource(
+        key=BENCH_SOURCE,
+        start_url=server.catalog_url,
+        base_url=BENCH_BASE_URL,
+        rate_limit=0,
+        max_pages=len(server.pages)
+    )
+
+
+async def bench_parser(server: StubCatalogServer, repeat: int = 3) -> dict:
+    """Разбор страниц в текущем процессе и полный обход заглушки через iter_product_pages."""
+    source = _bench_source(server)
+
+    parse_times = []
+    for html in server.pages:
+        started = time.perf_counter()
+        extract_page(html, settings.PARSER_BACKEND, source.selectors, source.base_url, source.page_param)
+        parse_times.append(time.perf_counter() - started)
+
+    runs = []
+    for _ in range(max(1, repeat)):
+        reset_page_cache()
+        pages = products = 0
+        started = time.perf_counter()
+        async for parsed_page in iter_product_pages(use_cache=False, source=source):
+            pages += 1
+            products += len(parsed_page.products)
+        elapsed = time.perf_counter() - started
+        runs.append({
+            "elapsed": round(elapsed, 4),
+            "pages": pages,
+            "products": products,
+            "pages_per_sec": _rate(pages, elapsed),
+            "products_per_sec": _rate(products, elapsed)
+        })
+
+    best = min(runs, key=lambda run: run["elapsed"])
+    return {
+        "backend": settings.PARSER_BACKEND,
+        "process_workers": settings.PARSER_PROCESS_WORKERS,
+        "concurrency": source.concurrency,
+        "pages": best["pages"],
+        "products": best["products"],
+        "parse_ms_p50": _ms(_percentile(parse_times, 50)),
+        "parse_ms_p99": _ms(_percentile(parse_times, 99)),
+        "pages_per_sec": best["pages_per_sec"],
+        "products_per_sec": best["products_per_sec"],
+        "runs": runs
+    }
+
+
+@contextmanager
+def _count_statements():
+    counts: Counter = Counter()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counts[statement.lstrip().split(None, 1)[0].upper()] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counts
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+async def _delete_bench_products():
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(Product).where(Product.source == BENCH_SOURCE))
+        await session.commit()
+
+
+async def _crawl_all(source: ParserSource, pages: int, client: httpx.AsyncClient) -> List[dict]:
+    semaphore = asyncio.Semaphore(max(1, source.concurrency))
+
+    async def crawl(page: int) -> dict:
+        async with semaphore:
+            return await _crawl_page(source, page, client)
+
+    return await asyncio.gather(*(crawl(page) for page in range(1, pages + 1)))
+
+
+async def bench_sync(server: StubCatalogServer, cycles: int = 3, change_fraction: float = 0.1) -> dict:
+    """
+    Циклы фонового обхода (_crawl_page: загрузка, разбор, синхронизация,
+    уведомления) против локального Postgres. Первый цикл — холодный,
+    в следующих заглушка меняет цену у change_fraction карточек.
+    Товары бенчмарка пишутся с source = BENCH_SOURCE и удаляются в конце.
+    """
+    engine.echo = False
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(upgrade_schema)
+    except Exception as e:
+        return {"skipped": f"database unavailable: {type(e).__name__}: {e}"}
+
+    source = _bench_source(server)
+    products_on_pages = server.product_count
+    await _delete_bench_products()
+    product_index.clear()
+    reset_page_cache()
+
+    results = []
+    try:
+        async with create_http_client(source.concurrency) as client:
+            for cycle in range(max(1, cycles)):
+                mutated = server.mutate(change_fraction, seed=cycle) if cycle else 0
+                with _count_statements() as statements:
+                    started = time.perf_counter()
+                    outcomes = await _crawl_all(source, len(server.pages), client)
+                    await event_coalescer.flush()
+                    elapsed = time.perf_counter() - started
+
+                results.append({
+                    "cycle": cycle + 1,
+                    "kind": "incremental" if cycle else "cold",
+                    "elapsed": round(elapsed, 4),
+                    "pages": sum(1 for outcome in outcomes if outcome["found"]),
+                    "changed_pages": sum(1 for outcome in outcomes if outcome.get("changed")),
+                    "mutated_products": mutated,
+                    "statements": sum(statements.values()),
+                    "statements_by_kind": dict(statements),
+                    "pages_per_sec": _rate(len(outcomes), elapsed),
+                    "products_per_sec": _rate(products_on_pages, elapsed)
+                })
+    finally:
+        await _delete_bench_products()
+        product_index.clear()
+        reset_page_cache()
+
+    incremental = [result for result in results if result["kind"] == "incremental"]
+    return {
+        "chunk_size": settings.DB_SYNC_CHUNK_SIZE,
+        "index_enabled": settings.PRODUCT_INDEX_ENABLED,
+        "products_on_pages": products_on_pages,
+        "cold_statements": results[0]["statements"],
+        "cold_products_per_sec": results[0]["products_per_sec"],
+        "incremental_statements": (
+            round(sum(result["statements"] for result in incremental) / len(incremental), 1)
+            if incremental else None
+        ),
+        "incremental_products_per_sec": (
+            round(sum(result["products_per_sec"] for result in incremental) / len(incremental), 1)
+            if incremental else None
+        ),
+        "cycles": results
+    }
+
+
+def _batch_message(rng: random.Random, number: int, batch_size: int) -> dict:
+    products = []
+    for index in range(batch_size):
+        product_id = number * batch_size + index + 1
+        products.append({
+            "id": product_id,
+            "name": f"Смартфон Apple iPhone 15 Pro Max 256 ГБ, титановый синий #{product_id}",
+            "price": float(rng.randrange(20_000, 250_000, 10)),
+            "old_price": None,
+            "source": rng.choice(FANOUT_SOURCES),
+            "url": f"{BENCH_BASE_URL}/apple/iphone/product-{product_id}"
+        })
+    split = batch_size // 2
+    return {
+        "type": "products_batch",
+        "data": {"created": products[:split], "updated": products[split:], "deleted": []}
+    }
+
+
+def _frame_seq(payload) -> int:
+    if isinstance(payload, bytes):
+        return msgpack.unpackb(payload)["seq"]
+    # seq дописывается последним ключом JSON-объекта
+    return int(payload[payload.rindex(":") + 1:-1])
+
+
+async def _drain(manager: ConnectionManager):
+    while any(not connection.queue.empty() for connection in manager.active_connections.values()):
+        await asyncio.sleep(0.001)
+    await asyncio.sleep(0)
+
+
+async def bench_fanout(
+        clients: int = 500, messages: int = 200, batch_size: int = 20,
+        msgpack_share: float = 0.5, subscribed_share: float = 0.3, seed: int = 1
+) -> dict:
+    """
+    Рассылка пачек products_batch на clients имитированных соединений.
+    Задержка доставки — от вызова broadcast до отправки кадра writer-задачей
+    клиента; она включает ожидание в очереди соединения.
+    """
+    rng = random.Random(seed)
+    manager = ConnectionManager()
+    sockets: List[FakeWebSocket] = []
+    for index in range(clients):
+        websocket = FakeWebSocket()
+        client_id = f"benchmark-{index}"
+        await manager.connect(websocket, client_id, "msgpack" if rng.random() < msgpack_share else "json")
+        if rng.random() < subscribed_share:
+            manager.subscribe(client_id, sources=[rng.choice(FANOUT_SOURCES)], min_price=100_000)
+        sockets.append(websocket)
+
+    sent_at: Dict[int, float] = {}
+    call_times = []
+    started = time.perf_counter()
+    for number in range(messages):
+        message = _batch_message(rng, number, batch_size)
+        call_started = time.perf_counter()
+        await manager.broadcast(message)
+        call_times.append(time.perf_counter() - call_started)
+        # Менеджер свежий и без fan-out из NATS: seq события совпадает с его номером
+        sent_at[number + 1] = call_started
+        await asyncio.sleep(0)
+    await _drain(manager)
+    elapsed = time.perf_counter() - started
+
+    latencies = [
+        received - sent_at[_frame_seq(payload)]
+        for websocket in sockets for received, payload in websocket.frames
+    ]
+    stats = manager.stats()
+    for client_id in list(manager.active_connections):
+        manager.disconnect(client_id)
+
+    frames_sent = stats["frames_sent"]
+    return {
+        "clients": stats["clients"],
+        "messages": messages,
+        "batch_size": batch_size,
+        "subscribed_share": subscribed_share,
+        "broadcast_ms_p50": _ms(_percentile(call_times, 50)),
+        "broadcast_ms_p99": _ms(_percentile(call_times, 99)),
+        "latency_ms_p50": _ms(_percentile(latencies, 50)),
+        "latency_ms_p99": _ms(_percentile(latencies, 99)),
+        "latency_ms_max": _ms(max(latencies, default=None)),
+        "frames_delivered": len(latencies),
+        "frames_per_sec": _rate(len(latencies), elapsed),
+        "dropped": stats["dropped"],
+        "bytes_sent": stats["bytes_sent"],
+        "bytes_per_frame": {
+            encoding: round(stats["bytes_sent"][encoding] / count, 1) if count else None
+            for encoding, count in frames_sent.items()
+        }
+    }
@@ -1,3 +1,4 @@
+from typing import List
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -10,6 +11,7 @@ class Settings(BaseSettings):
     DB_PASSWORD: str
     DB_HOST: str = "127.0.0.1"
     DB_PORT: int = 5432
+    DB_SYNC_CHUNK_SIZE: int = 500
 
     APP_HOST: str = "127.0.0.1"
     APP_PORT: int = 8000
@@ -18,10 +20,51 @@ class Settings(BaseSettings):
     APP_PROTOCOL: str = "http"
 
     NATS_URL: str = "nats://localhost:4222"
+    NATS_BATCH_SIZE: int = 100
+    NATS_BATCH_LINGER_MS: int = 20
+    NATS_PUBLISH_QUEUE_SIZE: int = 10000
+
+    WS_SEND_QUEUE_SIZE: int = 256
+    WS_SLOW_CLIENT_POLICY: str = "drop_oldest"
+    WS_REPLAY_BUFFER_SIZE: int = 1000
+    WS_SNAPSHOT_CACHE_SECONDS: float = 2.0
+    WS_PER_MESSAGE_DEFLATE: bool = True
+
+    EVENT_COALESCE_WINDOW_MS: int = 500
+
+    PRODUCT_CACHE_TTL_SECONDS: float = 30.0
+    PRODUCT_CACHE_MAX_ITEMS: int = 10000
+    PRODUCT_CACHE_MAX_LISTS: int = 256
+    PRODUCT_INDEX_ENABLED: bool = True
+
+    EXPORT_BATCH_SIZE: int = 1000
 
     PARSER_URL: str = "https://best-magazin.com/apple/iphone/?sort=p.price&order=ASC&limit=360"
     PARSER_INTERVAL_SECONDS: int = 120
-    PARSER_PAGE_DELAY: int = 2
+    PARSER_CONCURRENCY: int = 4
+    PARSER_RATE_LIMIT: float = 2.0
+    PARSER_MAX_RETRIES: int = 3
+    PARSER_BACKOFF_BASE: float = 1.0
+    PARSER_BACKEND: str = "lxml"
+    PARSER_PROCESS_WORKERS: int = 2
+    PARSER_CONDITIONAL_REQUESTS: bool = True
+    PARSER_MAX_CONNECTIONS: int = 10
+    PARSER_SOURCES: List[dict] = []
+
+    CRAWL_MAX_INTERVAL_SECONDS: int = 6 * 3600
+    CRAWL_REQUESTS_PER_HOUR: int = 3600
+    CRAWL_BUDGET_BURST: int = 20
+    CRAWL_CHANGE_ALPHA: float = 0.3
+    CRAWL_LEADER_ELECTION: bool = True
+    CRAWL_MAX_IN_FLIGHT: int = 50
+    CRAWL_TASK_TIMEOUT_SECONDS: float = 120.0
+
+    LEADER_LOCK_ID: int = 72_410_001
+    LEADER_CHECK_INTERVAL_SECONDS: float = 5.0
+    LEADER_RETRY_SECONDS: float = 10.0
+
+    TASK_WORKERS: int = 2
+    TASK_JOB_HISTORY: int = 100
 
     @property
     def DATABASE_URL(self) -> str:
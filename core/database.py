@@ -1,6 +1,9 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy import inspect
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.schema import CreateColumn
 from core.config import settings
+from core.metrics import DB_POOL_CHECKED_OUT, DB_POOL_OVERFLOW
 
 engine = create_async_engine(
     settings.DATABASE_URL,
@@ -11,6 +14,9 @@ engine = create_async_engine(
     future=True
 )
 
+DB_POOL_CHECKED_OUT.set_function(lambda: engine.pool.checkedout())
+DB_POOL_OVERFLOW.set_function(lambda: max(0, engine.pool.overflow()))
+
 Base = declarative_base()
 
 AsyncSessionLocal = async_sessionmaker(
@@ -22,6 +28,42 @@ AsyncSessionLocal = async_sessionmaker(
 )
 
 
+_data_migrations = []
+
+
+def data_migration(func):
+    """
+    Регистрирует шаг подготовки данных, который upgrade_schema выполняет
+    после добавления колонок и до создания индексов (например, очистка
+    дубликатов перед уникальным индексом). Шаг получает синхронное
+    соединение и инспектор и сам решает, нужен ли он.
+    """
+    _data_migrations.append(func)
+    return func
+
+
+def upgrade_schema(connection):
+    """
+    create_all не трогает уже существующие таблицы,
+    поэтому колонки и индексы, добавленные в модели позже, создаются отдельно.
+    Новые колонки должны быть nullable или иметь server_default.
+    """
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {ddl}')
+
+    for migration in _data_migrations:
+        migration(connection, inspector)
+
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
 async def get_db():
     async with AsyncSessionLocal() as session:
         try:
@@ -0,0 +1,62 @@
+"""
+Метрики Prometheus для горячих путей; отдаются на GET /metrics.
+
+Здесь только объявления. Замеры ставятся в местах выполнения, а гауги,
+которые читают состояние объектов (пул БД, соединения WebSocket, очередь
+NATS), привязываются к ним через set_function рядом с их созданием.
+"""
+from prometheus_client import Counter, Gauge, Histogram
+
+# Загрузка и разбор страницы занимают от миллисекунд до десятков секунд с повторами
+_PAGE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Отправка в сокет и публикация в NATS — доли миллисекунды при нормальной работе
+_FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+PAGE_FETCH_SECONDS = Histogram(
+    "parser_page_fetch_seconds", "HTTP request time for one listing page, per attempt",
+    ["source", "status"], buckets=_PAGE_BUCKETS
+)
+PAGE_PARSE_SECONDS = Histogram(
+    "parser_page_parse_seconds", "Time to extract products from one page, including executor wait",
+    ["source"], buckets=_PAGE_BUCKETS
+)
+PAGES_TOTAL = Counter(
+    "parser_pages_total", "Fetched listing pages by outcome", ["source", "outcome"]
+)
+
+DB_SYNC_SECONDS = Histogram(
+    "db_sync_seconds", "Time to sync one page of products with the database, commit included",
+    buckets=_PAGE_BUCKETS
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds", "Wait for a pooled database connection in the sync path",
+    buckets=_FAST_BUCKETS
+)
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Database connections currently checked out")
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "Database connections opened above pool_size")
+SYNC_PRODUCTS_TOTAL = Counter(
+    "sync_products_total", "Products processed by sync, by result", ["result"]
+)
+
+NATS_PUBLISH_SECONDS = Histogram(
+    "nats_publish_seconds", "Time from queueing a NATS message until its batch is flushed",
+    buckets=_FAST_BUCKETS
+)
+NATS_FLUSH_SECONDS = Histogram(
+    "nats_flush_seconds", "Time to publish and flush one batch of NATS messages",
+    buckets=_FAST_BUCKETS
+)
+NATS_QUEUE_DEPTH = Gauge("nats_publish_queue_depth", "Messages waiting in the NATS publish queue")
+
+WS_CLIENTS = Gauge("ws_clients", "Connected WebSocket clients", ["encoding"])
+WS_QUEUE_DEPTH = Gauge("ws_send_queue_depth", "Frames waiting in all WebSocket send queues")
+WS_QUEUE_DEPTH_MAX = Gauge("ws_send_queue_depth_max", "Longest WebSocket send queue")
+WS_SEND_SECONDS = Histogram(
+    "ws_send_seconds", "Time to hand one frame to the WebSocket", ["encoding"], buckets=_FAST_BUCKETS
+)
+WS_BYTES_SENT_TOTAL = Counter(
+    "ws_bytes_sent_total", "WebSocket payload bytes sent before permessage-deflate", ["encoding"]
+)
+WS_FRAMES_DROPPED_TOTAL = Counter(
+    "ws_frames_dropped_total", "Frames dropped or clients disconnected because the send queue was full"
+)
@@ -4,15 +4,19 @@ import uvicorn
 import asyncio
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from core.database import engine, Base
+from core.database import engine, Base, upgrade_schema
 from core.config import settings
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from routers import routes
 from service.nats_client import nats_client
 from service.background_tasks import update_products_task
+from service.parser_service import shutdown_parser_pool
 from service.websocket_manager import manager
-import json
+from service.event_coalescer import event_coalescer
+from service.job_service import job_manager
+from service.product_index import product_index
 
 load_dotenv()
 
@@ -22,39 +26,33 @@ async def lifespan(app: FastAPI):
     if settings.ENV in ["development", "production"]:
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(upgrade_schema)
         print("Database tables created")
 
-    await nats_client.connect()
+    await product_index.warm()
 
-    async def message_handler(msg):
-        subject = msg.subject
-        data = msg.data.decode()
-        print(f"NATS message received [{subject}]: {data}")
+    await nats_client.connect()
 
-        try:
-            nats_data = json.loads(data)
-            await manager.broadcast({
-                "type": "nats_event",
-                "source": "NATS",
-                "subject": subject,
-                "data": nats_data
-            })
-        except Exception as e:
-            print(f"Error forwarding NATS to WebSocket: {e}")
+    await manager.start_fanout()
 
-    await nats_client.subscribe("items.updates", message_handler)
+    job_manager.start()
 
     task = asyncio.create_task(update_products_task())
     app.state.background_task = task
 
     yield
 
+    await job_manager.stop()
+
     task.cancel()
     try:
         await task
     except asyncio.CancelledError:
         print("Background task stopped")
 
+    shutdown_parser_pool()
+
+    await event_coalescer.stop()
     await nats_client.disconnect()
 
     await engine.dispose()
@@ -75,6 +73,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 for router in routes:
@@ -87,23 +86,15 @@ async def root():
         "message": "Products Parser API",
         "docs": "/docs",
         "frontend(открыть html клиент)": "/monitor",
+        "metrics": "/metrics",
         "NATS": "http://localhost:8222/"
     }
 
 
-@app.get("/api/tasks/status")
-async def get_background_task_status():
-    task_exists = hasattr(app.state, 'background_task')
-
-    if not task_exists:
-        return {"status": "not_started"}
-
-    task_running = not app.state.background_task.done()
-
-    return {
-        "status": "running" if task_running else "stopped",
-        "is_running": task_running
-    }
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Метрики Prometheus: время загрузки, разбора и синхронизации страниц, NATS, WebSocket, пул БД"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.get("/monitor")
@@ -120,5 +111,6 @@ if __name__ == "__main__":
         host=settings.APP_HOST,
         port=settings.APP_PORT,
         reload=settings.APP_RELOAD,
-        log_level=settings.APP_LOG_LEVEL.lower()
+        log_level=settings.APP_LOG_LEVEL.lower(),
+        ws_per_message_deflate=settings.WS_PER_MESSAGE_DEFLATE
     )
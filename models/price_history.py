@@ -0,0 +1,16 @@
+from sqlalchemy import Column, BigInteger, Integer, Float, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from core.database import Base
+
+
+class PriceHistory(Base):
+    __tablename__ = "price_history"
+
+    id = Column(BigInteger, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    price = Column(Float, nullable=False)
+    ts = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_price_history_product_id_ts", product_id, ts),
+    )
@@ -1,6 +1,29 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Index, text
 from sqlalchemy.sql import func
-from core.database import Base
+from core.database import Base, data_migration
+
+DEFAULT_SOURCE = "best-magazin"
+DEFAULT_PORTS = {"http": ":80", "https": ":443"}
+
+
+def normalize_url(url: Optional[str]) -> Optional[str]:
+    """
+    Канонический вид URL товара — по нему товар ищется и он же уникален:
+    схема и хост в нижнем регистре, без порта по умолчанию, фрагмента
+    и завершающего слэша.
+    """
+    if not url or not url.strip():
+        return None
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    default_port = DEFAULT_PORTS.get(scheme)
+    if default_port and netloc.endswith(default_port):
+        netloc = netloc[:-len(default_port)]
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, netloc, path, parts.query, ""))
 
 
 class Product(Base):
@@ -13,5 +36,61 @@ class Product(Base):
     url = Column(Text, nullable=True)
     image_url = Column(Text, nullable=True)
     availability = Column(String(50), default="available")
+    source = Column(String(50), nullable=False, default=DEFAULT_SOURCE, server_default=DEFAULT_SOURCE, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        # Keyset-пагинация и фильтры GET /api/items
+        Index("ix_products_price_id", price, id),
+        Index("ix_products_availability_price_id", availability, price, id),
+        Index("ix_products_name_prefix", name, postgresql_ops={"name": "text_pattern_ops"}),
+        Index("ix_products_changed_at_id", func.coalesce(updated_at, created_at), id),
+        # Ключ синхронизации: INSERT ... ON CONFLICT (url)
+        Index("ux_products_url", url, unique=True),
+    )
+
+
+# Момент последнего изменения: updated_at заполняется только при UPDATE
+changed_at = func.coalesce(Product.updated_at, Product.created_at)
+
+
+@data_migration
+def _deduplicate_product_urls(connection, inspector):
+    """
+    Перед созданием уникального индекса по url приводит существующие URL
+    к каноническому виду и удаляет дубликаты, оставляя самую раннюю строку.
+    История цен дубликатов переносится на оставленную строку, иначе её
+    удалил бы ON DELETE CASCADE.
+    """
+    if "products" not in inspector.get_table_names():
+        return
+    if any(index["name"] == "ux_products_url" for index in inspector.get_indexes("products")):
+        return
+
+    rows = connection.execute(text("SELECT id, url FROM products WHERE url IS NOT NULL ORDER BY id"))
+    kept = {}
+    duplicates = []
+    renamed = []
+    for product_id, url in rows:
+        normalized = normalize_url(url)
+        if normalized is not None and normalized in kept:
+            duplicates.append({"duplicate_id": product_id, "kept_id": kept[normalized]})
+            continue
+        kept[normalized] = product_id
+        if normalized != url:
+            renamed.append({"id": product_id, "url": normalized})
+
+    if duplicates:
+        if "price_history" in inspector.get_table_names():
+            connection.execute(
+                text("UPDATE price_history SET product_id = :kept_id WHERE product_id = :duplicate_id"),
+                duplicates
+            )
+        connection.execute(
+            text("DELETE FROM products WHERE id = ANY(:ids)"),
+            {"ids": [duplicate["duplicate_id"] for duplicate in duplicates]}
+        )
+    if renamed:
+        connection.execute(text("UPDATE products SET url = :url WHERE id = :id"), renamed)
+    print(f"Product URLs normalized: {len(renamed)}, duplicates merged: {len(duplicates)}")
@@ -1,24 +1,120 @@
-from fastapi import APIRouter, Depends
+import zlib
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from datetime import datetime
+from typing import List, Literal, Optional, Union
 from core.database import get_db
-from schemas.product import ProductResponse, ProductCreate, ProductUpdate
+from schemas.product import (
+    ProductResponse, ProductColumnarResponse, ProductCreate, ProductUpdate, ProductBulkFilter, ProductBulkUpdate
+)
+from schemas.price_history import PriceHistoryBucket
 import service.product_service as product_service
+import service.price_history_service as price_history_service
 
 router = APIRouter(prefix="/items", tags=["Items"])
 
 
-@router.get("", response_model=List[ProductResponse])
+# Схема только для документации: format=json — массив товаров, format=columnar — колонки и строки
+@router.get("", response_model=Union[List[ProductResponse], ProductColumnarResponse])
 async def get_products(
-    skip: int = 0, limit: int = 100,
+    skip: int = Query(0, ge=0, description="Смещение (только без cursor, устаревший способ)"),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Курсор из заголовка X-Next-Cursor"),
+    sort: Literal["id", "price"] = Query("id", description="Порядок: по id или по (price, id)"),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    availability: Optional[str] = Query(None, description="available / out_of_stock"),
+    name_prefix: Optional[str] = Query(None, min_length=1, description="Начало названия"),
+    updated_since: Optional[datetime] = Query(None, description="Изменённые начиная с момента"),
+    source: Optional[str] = Query(None, description="Ключ источника парсера"),
+    format: Literal["json", "columnar"] = Query(
+        "json", description="columnar: {columns, rows, next_cursor} для массовой выгрузки"
+    ),
     db: AsyncSession = Depends(get_db)
 ):
-    return await product_service.get_products(db, skip, limit)
+    body, next_cursor = await product_service.list_products(
+        db, format=format, skip=skip, limit=limit, cursor=cursor, sort=sort,
+        min_price=min_price, max_price=max_price, availability=availability,
+        name_prefix=name_prefix, updated_since=updated_since, source=source
+    )
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    # Тело уже сериализовано: Response обходит повторную валидацию по response_model
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/export")
+async def export_products(
+    request: Request,
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    since: Optional[datetime] = Query(None, description="Только изменённые начиная с момента (дельта)")
+):
+    stream = product_service.export_products(format, since)
+    headers = {
+        "Content-Disposition": f'attachment; filename="products.{format}"',
+        # Ответ зависит от Accept-Encoding: общий кэш не должен отдавать gzip всем подряд
+        "Vary": "Accept-Encoding"
+    }
+    if _accepts_gzip(request.headers.get("accept-encoding", "")):
+        stream = _gzip_stream(stream)
+        headers["Content-Encoding"] = "gzip"
+
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(stream, media_type=media_type, headers=headers)
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """gzip разрешён явно с q > 0 или через * с q > 0, если gzip не упомянут."""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+async def _gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    return product_service.get_cache_stats()
 
 
 @router.get("/{product_id}", response_model=ProductResponse)
 async def get_product(product_id: int, db: AsyncSession = Depends(get_db)):
-    return await product_service.get_product_by_id(db, product_id)
+    return await product_service.get_product(db, product_id)
+
+
+@router.get("/{product_id}/history", response_model=List[PriceHistoryBucket])
+async def get_price_history(
+    product_id: int,
+    interval: Literal["minute", "hour", "day", "week", "month"] = Query("day"),
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    await product_service.get_product_by_id(db, product_id)
+    return await price_history_service.get_price_buckets(db, product_id, interval, since, until)
 
 
 @router.post("", response_model=ProductResponse, status_code=201)
@@ -40,9 +136,44 @@ async def delete_product(product_id: int, db: AsyncSession = Depends(get_db)):
 
 
 @router.delete("", status_code=200)
-async def delete_all_products(db: AsyncSession = Depends(get_db)):
-    deleted_count = await product_service.delete_all_products(db)
+async def delete_all_products(
+    ids: Optional[List[int]] = Query(None),
+    availability: Optional[str] = Query(None),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    name_prefix: Optional[str] = Query(None, min_length=1),
+    updated_before: Optional[datetime] = Query(None, description="Не изменявшиеся с этого момента"),
+    source: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    bulk_filter = ProductBulkFilter(
+        ids=ids, availability=availability, min_price=min_price, max_price=max_price,
+        name_prefix=name_prefix, updated_before=updated_before, source=source
+    )
+    if bulk_filter.is_empty():
+        deleted_count = await product_service.delete_all_products(db)
+        return {
+            "message": "All products deleted successfully",
+            "deleted_count": deleted_count
+        }
+
+    deleted_count = await product_service.delete_products(db, bulk_filter)
     return {
-        "message": "All products deleted successfully",
+        "message": "Matching products deleted successfully",
         "deleted_count": deleted_count
     }
+
+
+@router.patch("", status_code=200)
+async def bulk_update_products(bulk_update: ProductBulkUpdate, db: AsyncSession = Depends(get_db)):
+    if bulk_update.filter.is_empty() and not bulk_update.all:
+        raise HTTPException(
+            status_code=400,
+            detail="Empty filter would update every product; pass \"all\": true to confirm"
+        )
+
+    updated_count = await product_service.bulk_update_products(db, bulk_update)
+    return {
+        "message": "Products updated successfully",
+        "updated_count": updated_count
+    }
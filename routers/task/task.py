@@ -1,114 +1,80 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query, Request
 from typing import Optional
-from service.parser_service import parse_products
-from core.database import AsyncSessionLocal
-from models.product import Product
-from service.nats_client import nats_client
-from service.websocket_manager import manager
+from service.sources import get_source, get_sources, DEFAULT_SOURCE_KEY
+from service.crawl_scheduler import crawl_scheduler
+from service.job_service import job_manager
+from service.leader_election import leader_election
 
 router = APIRouter(prefix="/tasks", tags=["Tasks"])
 
 
-@router.post("/run")
+@router.get("/status")
+async def get_background_task_status(request: Request):
+    task = getattr(request.app.state, 'background_task', None)
+
+    if task is None:
+        return {"status": "not_started"}
+
+    task_running = not task.done()
+
+    return {
+        "status": "running" if task_running else "stopped",
+        "is_running": task_running,
+        "is_coordinator": leader_election.is_leader
+    }
+
+
+@router.get("/sources")
+async def list_sources():
+    return [
+        {
+            "key": parser_source.key,
+            "start_url": parser_source.start_url,
+            "rate_limit": parser_source.rate_limit,
+            "concurrency": parser_source.concurrency,
+            "max_pages": parser_source.max_pages
+        }
+        for parser_source in get_sources()
+    ]
+
+
+@router.get("/schedule")
+async def get_crawl_schedule():
+    return crawl_scheduler.stats()
+
+
+@router.post("/run", status_code=202)
 async def trigger_parser(
         start_page: int = Query(1, ge=1, description="Начальная страница парсинга"),
-        end_page: Optional[int] = Query(None, ge=1, description="Конечная страница (None = до конца)")
+        end_page: Optional[int] = Query(None, ge=1, description="Конечная страница (None = до конца)"),
+        force: bool = Query(False, description="Разобрать страницы заново, даже если они не изменились"),
+        source: str = Query(DEFAULT_SOURCE_KEY, description="Ключ источника из GET /api/tasks/sources")
 ):
     if end_page and end_page < start_page:
-        return {
-            "error": "end_page must be greater than or equal to start_page",
-            "start_page": start_page,
-            "end_page": end_page
-        }
-
-    products = await parse_products(start_page=start_page, end_page=end_page)
-    if not products:
-        return {
-            "message": "No products found",
-            "start_page": start_page,
-            "end_page": end_page,
-            "parsed_count": 0,
-            "created_count": 0
-        }
+        raise HTTPException(status_code=400, detail="end_page must be greater than or equal to start_page")
 
-    async with AsyncSessionLocal() as session:
-        created_count = 0
-        updated_count = 0
-        created_batch = []
-        updated_batch = []
-
-        for product_data in products:
-            try:
-                from sqlalchemy import select
-                stmt = select(Product).where(Product.url == product_data['url'])
-                result = await session.execute(stmt)
-                existing = result.scalar_one_or_none()
-
-                if existing:
-                    if existing.price != product_data['price']:
-                        old_price = existing.price
-                        existing.price = product_data['price']
-                        existing.old_price = product_data.get('old_price')
-                        updated_count += 1
-                        
-                        updated_batch.append({
-                            "id": existing.id,
-                            "name": existing.name,
-                            "price": product_data['price'],
-                            "old_price": old_price
-                        })
-                else:
-                    new_product = Product(**product_data)
-                    session.add(new_product)
-                    await session.flush()
-                    created_count += 1
-                    
-                    created_batch.append({
-                        "id": new_product.id,
-                        "name": new_product.name,
-                        "price": product_data['price']
-                    })
-            except Exception as e:
-                print(f"Error saving product: {e}")
-                continue
-
-        await session.commit()
-
-        if created_batch:
-            await nats_client.publish("items.updates", {
-                "action": "batch_created",
-                "count": len(created_batch),
-                "products": created_batch[:10]
-            })
-            
-            await manager.broadcast({
-                "type": "products_batch_created",
-                "data": {
-                    "count": len(created_batch),
-                    "products": created_batch[:10]
-                }
-            })
-
-        if updated_batch:
-            await nats_client.publish("items.updates", {
-                "action": "batch_updated",
-                "count": len(updated_batch),
-                "products": updated_batch[:10]
-            })
-            
-            await manager.broadcast({
-                "type": "products_batch_updated",
-                "data": {
-                    "count": len(updated_batch),
-                    "products": updated_batch[:10]
-                }
-            })
+    try:
+        parser_source = get_source(source)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
+    job, created = job_manager.submit(parser_source, start_page, end_page, force)
     return {
-        "message": "Parser executed successfully",
-        "start_page": start_page,
-        "end_page": end_page,
-        "parsed_count": len(products),
-        "created_count": created_count,
-        "updated_count": updated_count
+        "message": "Parser job queued" if created else "Identical job already in progress",
+        "job_id": job.id,
+        "deduplicated": not created,
+        "job": job.to_dict()
     }
+
+
+@router.get("/jobs")
+async def list_jobs():
+    return [job.to_dict() for job in job_manager.list_jobs()]
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
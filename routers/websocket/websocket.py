@@ -1,28 +1,72 @@
+import json
+from typing import Literal, Optional
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
+from pydantic import ValidationError
+from schemas.websocket import WSControlMessage
 from service.websocket_manager import manager
 
 socket_router = APIRouter(tags=["WebSocket"])
 
 
+async def _handle_control(client_id: str, data: str):
+    if data == "ping":
+        control = WSControlMessage(action="ping")
+    else:
+        try:
+            control = WSControlMessage.model_validate(json.loads(data))
+        except (ValueError, ValidationError) as e:
+            await manager.send_personal(client_id, {"type": "error", "detail": str(e)})
+            return
+
+    if control.action == "ping":
+        await manager.send_personal(client_id, {
+            "type": "pong",
+            "message": "Connected",
+            "client_id": client_id,
+            "total_clients": manager.get_client_count()
+        })
+        return
+
+    if control.action == "resync":
+        await manager.resync(client_id, control.last_seq, control.epoch)
+        return
+
+    topics = control.model_dump(exclude={"action", "last_seq", "epoch"})
+    if control.action == "subscribe":
+        subscription = manager.subscribe(client_id, **topics)
+    else:
+        subscription = manager.unsubscribe(client_id, **topics)
+
+    await manager.send_personal(client_id, {
+        "type": "subscription",
+        "data": subscription
+    })
+
+
 @socket_router.websocket("/ws/items")
 async def websocket_endpoint(
         websocket: WebSocket,
-        client_id: str = Query(..., description="Unique client identifier")
+        client_id: str = Query(..., description="Unique client identifier"),
+        last_seq: Optional[int] = Query(None, description="Последний полученный seq: дослать пропущенное"),
+        epoch: Optional[str] = Query(None, description="epoch, в котором получен last_seq"),
+        encoding: Literal["json", "msgpack"] = Query("json", description="json — текстовые кадры, msgpack — бинарные")
 ):
-    await manager.connect(websocket, client_id)
+    await manager.connect(websocket, client_id, encoding)
+    if last_seq is not None:
+        await manager.resync(client_id, last_seq, epoch)
 
     try:
         while True:
             data = await websocket.receive_text()
-            if data == "ping":
-                await websocket.send_json({
-                    "type": "pong",
-                    "message": "Connected",
-                    "client_id": client_id,
-                    "total_clients": manager.get_client_count()
-                })
+            await _handle_control(client_id, data)
     except WebSocketDisconnect:
-        manager.disconnect(client_id)
+        manager.disconnect(client_id, websocket)
     except Exception as e:
         print(f"WebSocket error for client {client_id}: {e}")
-        manager.disconnect(client_id)
+        manager.disconnect(client_id, websocket)
+
+
+@socket_router.get("/ws/stats")
+async def get_websocket_stats():
+    """Клиенты и отправленные байты/кадры по кодировкам (до сжатия permessage-deflate)."""
+    return manager.stats()
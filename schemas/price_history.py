@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+from datetime import datetime
+
+
+class PriceHistoryBucket(BaseModel):
+    bucket: datetime
+    min_price: float
+    max_price: float
+    last_price: float
+    samples: int
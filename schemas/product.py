@@ -1,6 +1,7 @@
 from pydantic import BaseModel, ConfigDict
 from datetime import datetime
-from typing import Optional
+from typing import Any, List, Optional
+from models.product import DEFAULT_SOURCE
 
 
 class ProductBase(BaseModel):
@@ -10,6 +11,7 @@ class ProductBase(BaseModel):
     url: Optional[str] = None
     image_url: Optional[str] = None
     availability: str = "available"
+    source: str = DEFAULT_SOURCE
 
 
 class ProductCreate(ProductBase):
@@ -23,6 +25,7 @@ class ProductUpdate(BaseModel):
     url: Optional[str] = None
     image_url: Optional[str] = None
     availability: Optional[str] = None
+    source: Optional[str] = None
 
 
 class ProductResponse(ProductBase):
@@ -31,3 +34,31 @@ class ProductResponse(ProductBase):
     updated_at: Optional[datetime] = None
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class ProductColumnarResponse(BaseModel):
+    """Ответ GET /items?format=columnar: значения в rows идут в порядке columns (поля ProductResponse)."""
+    columns: List[str]
+    rows: List[List[Any]]
+    next_cursor: Optional[str] = None
+
+
+class ProductBulkFilter(BaseModel):
+    ids: Optional[List[int]] = None
+    availability: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    name_prefix: Optional[str] = None
+    updated_before: Optional[datetime] = None
+    source: Optional[str] = None
+
+    def is_empty(self) -> bool:
+        return not self.model_dump(exclude_none=True)
+
+
+class ProductBulkUpdate(BaseModel):
+    filter: ProductBulkFilter = ProductBulkFilter()
+    # Пустой фильтр затрагивает весь каталог — только по явному all: true
+    all: bool = False
+    availability: Optional[str] = None
+    old_price: Optional[float] = None
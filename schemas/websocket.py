@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+from typing import List, Literal, Optional
+
+
+class WSControlMessage(BaseModel):
+    """
+    Управляющее сообщение клиента /ws/items.
+    subscribe добавляет темы к подписке, unsubscribe убирает перечисленные
+    (без тем — снимает все фильтры, клиент снова получает всё).
+    events: created / updated / deleted или тип сообщения (job_progress, ...).
+    resync досылает пропущенное после last_seq в пределах epoch.
+    """
+    action: Literal["subscribe", "unsubscribe", "ping", "resync"]
+    product_ids: Optional[List[int]] = None
+    events: Optional[List[str]] = None
+    sources: Optional[List[str]] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    last_seq: Optional[int] = None
+    epoch: Optional[str] = None
@@ -17,6 +17,12 @@ let natsCount = 0;
 let createdCount = 0;
 let updatedCount = 0;
 let parserRunning = false;
+// Позиция в потоке событий сервера: при переподключении досылается только пропущенное
+let lastSeq = null;
+let epoch = null;
+// Кадры обрабатываются строго по очереди: снимок распаковывается асинхронно,
+// и следующий за ним кадр не должен его обогнать
+let frameChain = Promise.resolve();
 
 //  WEBSOCKET CONNECTION
 function connect() {
@@ -24,7 +30,12 @@ function connect() {
         ws.close();
     }
 
-    ws = new WebSocket(`ws://localhost:8000/api/ws/items?client_id=${clientId}`);
+    let url = `ws://localhost:8000/api/ws/items?client_id=${clientId}`;
+    if (epoch !== null && lastSeq !== null) {
+        url += `&last_seq=${lastSeq}&epoch=${epoch}`;
+    }
+    ws = new WebSocket(url);
+    ws.binaryType = 'arraybuffer';
 
     ws.onopen = () => {
         document.getElementById('status').textContent = `Connected ✓ (ID: ${clientId.slice(-8)})`;
@@ -33,54 +44,9 @@ function connect() {
     };
 
     ws.onmessage = (event) => {
-        const data = JSON.parse(event.data);
-        messageCount++;
-
-        const isNats = data.type === 'nats_event';
-        const source = isNats ? 'NATS' : 'WebSocket';
-
-        if (isNats) {
-            natsCount++;
-            addMessage(JSON.stringify(data.data, null, 2), 'nats', source, true);
-        } else {
-            wsCount++;
-
-            if (data.type === 'products_batch_created') {
-                createdCount += data.data.count;
-                const msg = `Batch Created: ${data.data.count} products\n\nFirst 10:\n${JSON.stringify(data.data.products, null, 2)}`;
-                addMessage(msg, 'created', source, false);
-            } else if (data.type === 'products_batch_updated') {
-                updatedCount += data.data.count;
-                const msg = `Batch Updated: ${data.data.count} products\n\nFirst 10:\n${JSON.stringify(data.data.products, null, 2)}`;
-                addMessage(msg, 'updated', source, false);
-            } else if (data.type === 'product_created') {
-                createdCount++;
-                addMessage(JSON.stringify(data, null, 2), 'created', source, false);
-            } else if (data.type === 'product_updated') {
-                updatedCount++;
-                addMessage(JSON.stringify(data, null, 2), 'updated', source, false);
-            } else if (data.type === 'product_deleted') {
-                addMessage(JSON.stringify(data, null, 2), 'deleted', source, false);
-            } else if (data.type === 'all_products_deleted') {
-                addMessage(
-                    `ALL PRODUCTS DELETED\n${data.data.message}`,
-                    'deleted',
-                    source,
-                    false
-                );
-            } else if (data.type === 'pong') {
-                addMessage(
-                    `Pong received. Total clients: ${data.total_clients}`,
-                    'success',
-                    'WebSocket',
-                    false
-                );
-            } else {
-                addMessage(JSON.stringify(data, null, 2), 'success', source, false);
-            }
-        }
-
-        updateStats();
+        frameChain = frameChain
+            .then(() => handleMessage(event.data))
+            .catch(error => addMessage('Frame error: ' + error.message, 'error', 'System', false));
     };
 
 
@@ -100,6 +66,101 @@ function connect() {
     };
 }
 
+async function handleMessage(raw) {
+    if (raw instanceof ArrayBuffer) {
+        handleSnapshot(await gunzipJson(raw));
+    } else {
+        const data = JSON.parse(raw);
+        if (data.type === 'resync') {
+            epoch = data.epoch;
+            data.events.forEach(handleFrame);
+            lastSeq = Math.max(lastSeq || 0, data.seq);
+            addMessage(`Resync (${data.mode}): ${data.events.length} missed events`, 'info', 'WebSocket', false);
+        } else {
+            handleFrame(data);
+        }
+    }
+
+    updateStats();
+}
+
+async function gunzipJson(buffer) {
+    const stream = new Blob([buffer]).stream().pipeThrough(new DecompressionStream('gzip'));
+    return JSON.parse(await new Response(stream).text());
+}
+
+function handleSnapshot(snapshot) {
+    epoch = snapshot.epoch;
+    lastSeq = snapshot.seq;
+    addMessage(`Snapshot: ${snapshot.data.length} products (seq ${snapshot.seq})`, 'info', 'WebSocket', false);
+}
+
+function handleFrame(data) {
+    if (data.seq !== undefined) {
+        lastSeq = Math.max(lastSeq || 0, data.seq);
+    }
+    messageCount++;
+
+    const isNats = data.type === 'nats_event';
+    const source = isNats ? 'NATS' : 'WebSocket';
+
+    if (isNats) {
+        natsCount++;
+        addMessage(JSON.stringify(data.data, null, 2), 'nats', source, true);
+    } else {
+        wsCount++;
+
+        if (data.type === 'products_batch_created') {
+            createdCount += data.data.count;
+            const msg = `Batch Created: ${data.data.count} products\n\nFirst 10:\n${JSON.stringify(data.data.products, null, 2)}`;
+            addMessage(msg, 'created', source, false);
+        } else if (data.type === 'products_batch_updated') {
+            updatedCount += data.data.count;
+            const msg = `Batch Updated: ${data.data.count} products\n\nFirst 10:\n${JSON.stringify(data.data.products, null, 2)}`;
+            addMessage(msg, 'updated', source, false);
+        } else if (data.type === 'products_batch') {
+            const { created, updated, deleted } = data.data;
+            createdCount += created.length;
+            updatedCount += updated.length;
+            const msg = `Batch: ${created.length} created, ${updated.length} updated, ${deleted.length} deleted\n\n` +
+                        JSON.stringify(data.data, null, 2);
+            const type = updated.length ? 'updated' : (created.length ? 'created' : 'deleted');
+            addMessage(msg, type, source, false);
+        } else if (data.type === 'product_created') {
+            createdCount++;
+            addMessage(JSON.stringify(data, null, 2), 'created', source, false);
+        } else if (data.type === 'product_updated') {
+            updatedCount++;
+            addMessage(JSON.stringify(data, null, 2), 'updated', source, false);
+        } else if (data.type === 'product_deleted') {
+            addMessage(JSON.stringify(data, null, 2), 'deleted', source, false);
+        } else if (data.type === 'all_products_deleted') {
+            addMessage(
+                `ALL PRODUCTS DELETED\n${data.data.message}`,
+                'deleted',
+                source,
+                false
+            );
+        } else if (data.type === 'job_progress') {
+            const job = data.data;
+            updateJobProgress(job);
+            if (job.status !== 'running') {
+                addMessage(`Job ${job.id.slice(0, 8)}: ${job.status}`, 'info', source, false);
+            }
+        } else if (data.type === 'pong') {
+            addMessage(
+                `Pong received. Total clients: ${data.total_clients}`,
+                'success',
+                'WebSocket',
+                false
+            );
+        } else {
+            addMessage(JSON.stringify(data, null, 2), 'success', source, false);
+        }
+    }
+
+}
+
 function disconnect() {
     if (ws) {
         ws.close();
@@ -137,6 +198,38 @@ function setupAutoReconnect() {
 }
 
 //  API CALLS
+let currentJobId = null;
+
+function updateJobProgress(job) {
+    if (job.id !== currentJobId) {
+        return;
+    }
+    const progressDiv = document.getElementById('parserProgress');
+    const progressFill = progressDiv.querySelector('.progress-fill');
+    const progressText = progressDiv.querySelector('.progress-text');
+
+    const total = job.end_page ? job.end_page - job.start_page + 1 : null;
+    const percent = total ? Math.min(100, Math.round(job.pages_done / total * 100)) : 60;
+    progressFill.style.width = `${job.status === 'completed' ? 100 : percent}%`;
+    progressText.textContent = `${job.status}: ${job.pages_done} pages, ` +
+                               `${job.parsed_count} items, ${job.elapsed}s`;
+}
+
+async function waitForJob(jobId) {
+    while (true) {
+        const response = await fetch(`http://localhost:8000/api/tasks/${jobId}`);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+        }
+        const job = await response.json();
+        updateJobProgress(job);
+        if (['completed', 'failed', 'cancelled'].includes(job.status)) {
+            return job;
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
 async function triggerParser() {
     if (parserRunning) {
         addMessage('Parser is already running!', 'info', 'System', false);
@@ -156,17 +249,12 @@ async function triggerParser() {
     const progressText = progressDiv.querySelector('.progress-text');
 
     progressDiv.style.display = 'block';
-    progressFill.style.width = '30%';
-    progressText.textContent = 'Starting parser...';
+    progressFill.style.width = '10%';
+    progressText.textContent = 'Queueing parser job...';
 
     addMessage('🚀 Parser started! Fetching products from page 1...', 'info', 'System', false);
 
     try {
-        const startTime = Date.now();
-
-        progressFill.style.width = '60%';
-        progressText.textContent = 'Fetching products...';
-
         const response = await fetch('http://localhost:8000/api/tasks/run?start_page=1&end_page=1', {
             method: 'POST'
         });
@@ -175,16 +263,19 @@ async function triggerParser() {
             throw new Error(`HTTP ${response.status}: ${response.statusText}`);
         }
 
-        progressFill.style.width = '90%';
-        progressText.textContent = 'Processing results...';
+        const queued = await response.json();
+        currentJobId = queued.job_id;
+        addMessage(`${queued.message} (job ${currentJobId.slice(0, 8)})`, 'info', 'API', false);
 
-        const result = await response.json();
-        const duration = ((Date.now() - startTime) / 1000).toFixed(2);
+        const result = await waitForJob(currentJobId);
+        if (result.status !== 'completed') {
+            throw new Error(result.error || `job ${result.status}`);
+        }
 
         progressFill.style.width = '100%';
         progressText.textContent = '✅ Completed!';
 
-        const resultMessage = `Parser completed in ${duration}s\n` +
+        const resultMessage = `Parser completed in ${result.elapsed}s\n` +
                             `Parsed: ${result.parsed_count} products\n` +
                             `Created: ${result.created_count}\n` +
                             `Updated: ${result.updated_count}`;
@@ -210,6 +301,7 @@ async function triggerParser() {
             progressFill.style.background = 'linear-gradient(90deg, #667eea, #764ba2)';
         }, 3000);
     } finally {
+        currentJobId = null;
         button.disabled = false;
         button.innerHTML = originalText;
         button.classList.remove('btn-loading');
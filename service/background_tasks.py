@@ -1,94 +1,254 @@
 import asyncio
-from sqlalchemy import select
-from core.database import AsyncSessionLocal
-from models.product import Product
-from service.parser_service import parse_products
+import json
+import httpx
+from typing import Dict, Optional, Set
+from service.parser_service import fetch_page, remember_page, create_http_client, PageFetchError
+from service.sources import ParserSource, get_source, get_sources
+from service.crawl_scheduler import crawl_scheduler, PageKey
+from service.leader_election import leader_election
 from service.nats_client import nats_client
-from service.websocket_manager import manager
+from service.product_service import invalidate_product_cache
+from service.sync_service import sync_page, SyncResult
+from service.event_coalescer import event_coalescer
 from core.config import settings
 
+CRAWL_TASKS_SUBJECT = "crawl.tasks"
+CRAWL_RESULTS_SUBJECT = "crawl.results"
+CRAWL_WORKERS_QUEUE = "crawl-workers"
+
+
+async def _notify_sync_result(sync_result: SyncResult):
+    for product in sync_result.updated:
+        print(
+            f"Updated: {product['name'][:50]}... ({product['old_price']} → {product['price']} руб.)"
+        )
+
+        await event_coalescer.add(
+            "updated", product,
+            nats_message={
+                "action": "updated",
+                "product_id": product['id'],
+                "product_name": product['name'],
+                "old_price": product['old_price'],
+                "new_price": product['price']
+            },
+            ws_message={
+                "type": "product_updated",
+                "data": product
+            }
+        )
+
+    for product in sync_result.created:
+        await event_coalescer.add(
+            "created", product,
+            nats_message={
+                "action": "created",
+                "product_id": product['id'],
+                "product_name": product['name'],
+                "price": product['price']
+            },
+            ws_message={
+                "type": "product_created",
+                "data": product
+            }
+        )
+
+
+async def _crawl_page(source: ParserSource, page: int, client: httpx.AsyncClient) -> dict:
+    """
+    Загружает и синхронизирует страницу; возвращает итог для планировщика.
+    found=False — страницы нет (404 или пустая), error — временный сбой загрузки.
+    """
+    try:
+        parsed_page = await fetch_page(source, page, client)
+    except PageFetchError as e:
+        return {"source": source.key, "page": page, "found": False, "error": str(e)}
+    if parsed_page is None:
+        return {"source": source.key, "page": page, "found": False}
+
+    changed = False
+    if not parsed_page.not_modified:
+        sync_result = await sync_page(parsed_page.url, parsed_page.products)
+
+        changed = bool(sync_result.created or sync_result.updated)
+        if changed:
+            invalidate_product_cache([product['id'] for product in sync_result.updated])
+            print(
+                f"[{source.key}] page {page}: created {sync_result.created_count}, "
+                f"updated {sync_result.updated_count}"
+            )
+        await _notify_sync_result(sync_result)
+
+    remember_page(parsed_page)
+    return {
+        "source": source.key,
+        "page": page,
+        "found": True,
+        "changed": changed,
+        "last_page": parsed_page.last_page
+    }
+
+
+def _apply_outcome(outcome: dict):
+    if outcome.get("error"):
+        crawl_scheduler.retry_later(outcome["source"], outcome["page"])
+    elif outcome["found"]:
+        crawl_scheduler.observe(outcome["source"], outcome["page"], outcome["changed"], outcome["last_page"])
+    else:
+        crawl_scheduler.forget(outcome["source"], outcome["page"])
+
+
+class CrawlWorkers:
+    """
+    Распределение обхода между репликами через NATS.
+
+    Координатор публикует страницы в crawl.tasks; все реплики подписаны на этот
+    subject в одной queue group, поэтому каждую страницу обрабатывает ровно одна
+    из них. Итог публикуется в crawl.results и доходит до всех реплик: каждая
+    обновляет своё расписание, и при смене лидера новый координатор продолжает
+    с актуальными оценками изменчивости.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._waiters: Dict[PageKey, asyncio.Future] = {}
+        self._subscribed = False
+
+    async def start(self, client: httpx.AsyncClient):
+        self._client = client
+        self._slots = asyncio.Semaphore(settings.PARSER_MAX_CONNECTIONS)
+        # После перезапуска обхода подписки остаются прежними, иначе задачи приходили бы дважды
+        if self._subscribed or not nats_client.connected:
+            return
+        await nats_client.subscribe(CRAWL_TASKS_SUBJECT, self._on_task, queue=CRAWL_WORKERS_QUEUE)
+        await nats_client.subscribe(CRAWL_RESULTS_SUBJECT, self._on_result)
+        self._subscribed = True
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def dispatch(self, source: ParserSource, page: int):
+        """Отдаёт страницу любой реплике и ждёт итога не дольше CRAWL_TASK_TIMEOUT_SECONDS."""
+        key = (source.key, page)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[key] = waiter
+        try:
+            await nats_client.publish(CRAWL_TASKS_SUBJECT, {"source": source.key, "page": page})
+            await asyncio.wait_for(waiter, timeout=settings.CRAWL_TASK_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            print(f"No result for {source.key} page {page}, rescheduling")
+            crawl_scheduler.retry_later(source.key, page)
+        finally:
+            self._waiters.pop(key, None)
+
+    async def _on_task(self, msg):
+        data = json.loads(msg.data.decode())
+        # Пока все слоты заняты, следующие задачи ждут в буфере подписки
+        await self._slots.acquire()
+        task = asyncio.create_task(self._work(data["source"], data["page"]))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _work(self, source_key: str, page: int):
+        try:
+            outcome = await _crawl_page(get_source(source_key), page, self._client)
+        except Exception as e:
+            print(f"Error crawling {source_key} page {page}: {e}")
+            outcome = {"source": source_key, "page": page, "found": False, "error": str(e)}
+        finally:
+            self._slots.release()
+        await nats_client.publish(CRAWL_RESULTS_SUBJECT, outcome)
+
+    async def _on_result(self, msg):
+        outcome = json.loads(msg.data.decode())
+        _apply_outcome(outcome)
+        waiter = self._waiters.get((outcome["source"], outcome["page"]))
+        if waiter is not None and not waiter.done():
+            waiter.set_result(outcome)
+
+
+crawl_workers = CrawlWorkers()
+
+
+async def _coordinate(client: httpx.AsyncClient):
+    """
+    Цикл координатора: берёт из crawl_scheduler страницы по сроку и отдаёт их
+    воркерам через NATS, а без NATS обходит сам.
+    """
+    distributed = nats_client.connected
+    in_flight = asyncio.Semaphore(
+        settings.CRAWL_MAX_IN_FLIGHT if distributed else settings.PARSER_MAX_CONNECTIONS
+    )
+    tasks = set()
+
+    async def run(source: ParserSource, page: int):
+        try:
+            if distributed:
+                await crawl_workers.dispatch(source, page)
+            else:
+                _apply_outcome(await _crawl_page(source, page, client))
+        except asyncio.CancelledError:
+            # Координатор остановлен: страница не должна остаться «в обходе» навсегда
+            crawl_scheduler.retry_later(source.key, page)
+            raise
+        except Exception as e:
+            print(f"Error crawling {source.key} page {page}: {e}")
+            crawl_scheduler.retry_later(source.key, page)
+        finally:
+            in_flight.release()
+
+    try:
+        while True:
+            await in_flight.acquire()
+            source, page = await crawl_scheduler.next_due()
+            task = asyncio.create_task(run(source, page))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
 
 async def update_products_task():
-    print(f"Background task started (interval: {settings.PARSER_INTERVAL_SECONDS}s)")
+    """
+    Обходит страницы всех источников по адаптивному расписанию crawl_scheduler:
+    часто меняющиеся страницы чаще, стабильные реже, в пределах общего бюджета
+    запросов. Загрузки идут через один HTTP-клиент, поэтому число соединений
+    реплики ограничено PARSER_MAX_CONNECTIONS.
+
+    При нескольких репликах расписание ведёт только лидер (advisory lock),
+    а сами страницы обходят все реплики через NATS queue group.
+    """
+    print(
+        f"Background task started (interval: {settings.PARSER_INTERVAL_SECONDS}"
+        f"-{settings.CRAWL_MAX_INTERVAL_SECONDS}s, budget: {settings.CRAWL_REQUESTS_PER_HOUR}/h)"
+    )
     while True:
         try:
-            products_data = await parse_products(start_page=1, end_page=None)
-
-            if not products_data:
-                await asyncio.sleep(settings.PARSER_INTERVAL_SECONDS)
-                continue
-
-            async with AsyncSessionLocal() as session:
-                updated_count = 0
-                created_count = 0
-
-                for product_data in products_data:
-                    try:
-                        stmt = select(Product).where(Product.url == product_data['url'])
-                        result = await session.execute(stmt)
-                        existing = result.scalar_one_or_none()
-
-                        if existing:
-                            if existing.price != product_data['price']:
-                                old_price = existing.price
-                                existing.price = product_data['price']
-                                if product_data.get('old_price'):
-                                    existing.old_price = product_data['old_price']
-                                updated_count += 1
-
-                                print(
-                                    f"Updated: {existing.name[:50]}... ({old_price} → {product_data['price']} руб.)"
-                                )
-
-                                await nats_client.publish("items.updates", {
-                                    "action": "updated",
-                                    "product_id": existing.id,
-                                    "product_name": existing.name,
-                                    "old_price": old_price,
-                                    "new_price": product_data['price']
-                                })
-
-                                await manager.broadcast({
-                                    "type": "product_updated",
-                                    "data": {
-                                        "id": existing.id,
-                                        "name": existing.name,
-                                        "price": product_data['price'],
-                                        "old_price": old_price
-                                    }
-                                })
-                        else:
-                            new_product = Product(**product_data)
-                            session.add(new_product)
-                            await session.flush()
-                            created_count += 1
-
-                            if created_count % 50 == 0:
-                                print(f"Created {created_count} products so far...")
-
-                            await nats_client.publish("items.updates", {
-                                "action": "created",
-                                "product_id": new_product.id,
-                                "product_name": new_product.name,
-                                "price": product_data['price']
-                            })
-
-                            await manager.broadcast({
-                                "type": "product_created",
-                                "data": {
-                                    "id": new_product.id,
-                                    "name": new_product.name,
-                                    "price": product_data['price']
-                                }
-                            })
-                    except Exception as e:
-                        print(f"Error processing product: {e}")
-                        continue
-
-                await session.commit()
-                print(f"Update completed. Created: {created_count}, Updated: {updated_count}")
-
+            await _run_crawler()
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            print(f"Error in background task: {e}")
+            print(f"Error in background task: {type(e).__name__}: {e}")
 
         await asyncio.sleep(settings.PARSER_INTERVAL_SECONDS)
+
+
+async def _run_crawler():
+    for source in get_sources():
+        crawl_scheduler.add_source(source)
+
+    async with create_http_client(settings.PARSER_MAX_CONNECTIONS) as client:
+        await crawl_workers.start(client)
+        try:
+            if settings.CRAWL_LEADER_ELECTION:
+                await leader_election.run(lambda: _coordinate(client))
+            else:
+                await _coordinate(client)
+        finally:
+            await crawl_workers.stop()
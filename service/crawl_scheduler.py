@@ -0,0 +1,253 @@
+import asyncio
+import heapq
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+from core.config import settings
+from service.sources import ParserSource
+
+PageKey = Tuple[str, int]
+
+
+@dataclass
+class PageSchedule:
+    """
+    Состояние одной страницы: оценка вероятности изменения между обходами
+    (экспоненциальное среднее) и вытекающий из неё интервал до следующего обхода.
+    """
+    source: str
+    page: int
+    due: float
+    change_rate: float = 1.0
+    interval: float = 0.0
+    fetches: int = 0
+    changes: int = 0
+
+
+class RequestBudget:
+    """Token bucket: не больше CRAWL_REQUESTS_PER_HOUR загрузок страниц в час на процесс."""
+
+    def __init__(self, per_hour: float, burst: int):
+        self.rate = per_hour / 3600
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+
+class CrawlScheduler:
+    """
+    Очередь обходов в куче по времени следующего обхода страницы.
+
+    После каждой синхронизации страница сообщает, изменилось ли на ней что-то.
+    Частота изменений сглаживается (CRAWL_CHANGE_ALPHA), интервал лежит между
+    PARSER_INTERVAL_SECONDS для постоянно меняющихся страниц и
+    CRAWL_MAX_INTERVAL_SECONDS для стабильных. Общий бюджет запросов ограничивает
+    число загрузок в час, поэтому нагрузка растёт с реальной изменчивостью
+    каталога, а не с числом страниц.
+
+    Новые страницы считаются изменчивыми и обходятся сразу. Страницы 2..N
+    появляются в расписании по пагинации первой страницы источника.
+
+    Одновременно в обходе не больше source.concurrency страниц источника:
+    подошедшие по сроку страницы занятого источника откладываются и
+    возвращаются в кучу, когда одна из его страниц завершится.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, PageKey]] = []
+        self._pages: Dict[PageKey, PageSchedule] = {}
+        self._sources: Dict[str, ParserSource] = {}
+        self._last_page: Dict[str, int] = {}
+        self._running: Dict[str, int] = {}
+        self._blocked: Dict[str, Set[PageKey]] = {}
+        self._changed = asyncio.Event()
+        self._counter = 0
+        self.budget = RequestBudget(settings.CRAWL_REQUESTS_PER_HOUR, settings.CRAWL_BUDGET_BURST)
+
+    def add_source(self, source: ParserSource):
+        self._sources[source.key] = source
+        self._ensure_page(source.key, 1, due=time.monotonic())
+
+    def _ensure_page(self, source_key: str, page: int, due: float):
+        key = (source_key, page)
+        if key in self._pages:
+            return
+        self._pages[key] = PageSchedule(source_key, page, due, interval=settings.PARSER_INTERVAL_SECONDS)
+        self._push(self._pages[key])
+
+    def _push(self, schedule: PageSchedule):
+        self._counter += 1
+        heapq.heappush(self._heap, (schedule.due, self._counter, (schedule.source, schedule.page)))
+        # Устаревшие записи удаляются только при извлечении; на репликах,
+        # которые не координируют обход, куча иначе росла бы бесконечно
+        if len(self._heap) > 2 * len(self._pages) + 64:
+            self._rebuild()
+        self._changed.set()
+
+    def _rebuild(self):
+        self._heap = [
+            (schedule.due, index, key)
+            for index, (key, schedule) in enumerate(self._pages.items())
+            if schedule.due != float("inf")
+        ]
+        heapq.heapify(self._heap)
+
+    def _interval(self, change_rate: float) -> float:
+        min_interval = max(1, settings.PARSER_INTERVAL_SECONDS)
+        max_interval = max(min_interval, settings.CRAWL_MAX_INTERVAL_SECONDS)
+        # Геометрическая интерполяция: каждые ~10% стабильности заметно удлиняют интервал
+        return min_interval * (max_interval / min_interval) ** (1 - change_rate)
+
+    def _discard_stale(self):
+        while self._heap:
+            due, _, key = self._heap[0]
+            schedule = self._pages.get(key)
+            if schedule is not None and schedule.due == due:
+                return
+            heapq.heappop(self._heap)
+
+    async def next_due(self) -> Tuple[ParserSource, int]:
+        """Ждёт ближайшую по сроку страницу и токен бюджета."""
+        while True:
+            self._discard_stale()
+            if not self._heap:
+                self._changed.clear()
+                await self._changed.wait()
+                continue
+
+            due, _, key = self._heap[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            schedule = self._pages[key]
+            source = self._sources[schedule.source]
+            if self._running.get(source.key, 0) >= max(1, source.concurrency):
+                self._blocked.setdefault(source.key, set()).add(key)
+                continue
+
+            try:
+                await self.budget.acquire()
+            except asyncio.CancelledError:
+                self._push(schedule)
+                raise
+            # До загрузки страница не может снова стать «готовой»
+            schedule.due = float("inf")
+            self._running[source.key] = self._running.get(source.key, 0) + 1
+            return source, schedule.page
+
+    def _finish(self, schedule: PageSchedule):
+        """Страница, выданная next_due, завершилась: освобождает место источника."""
+        if schedule.due != float("inf"):
+            return
+        self._running[schedule.source] = max(0, self._running.get(schedule.source, 0) - 1)
+        for key in self._blocked.pop(schedule.source, ()):
+            blocked = self._pages.get(key)
+            if blocked is not None and blocked.due != float("inf"):
+                self._push(blocked)
+
+    def observe(self, source_key: str, page: int, changed: bool, last_page: Optional[int] = None):
+        """Результат обхода страницы: пересчитывает частоту изменений и ставит следующий обход."""
+        key = (source_key, page)
+        schedule = self._pages.get(key)
+        if schedule is None:
+            return
+
+        self._finish(schedule)
+        alpha = settings.CRAWL_CHANGE_ALPHA
+        schedule.fetches += 1
+        schedule.changes += int(changed)
+        schedule.change_rate = alpha * float(changed) + (1 - alpha) * schedule.change_rate
+        schedule.interval = self._interval(schedule.change_rate)
+        schedule.due = time.monotonic() + schedule.interval
+        self._push(schedule)
+
+        if page == 1 and last_page:
+            self._set_last_page(source_key, last_page)
+
+    def retry_later(self, source_key: str, page: int):
+        """Загрузка не удалась: оценка изменчивости не меняется, повтор через минимальный интервал."""
+        schedule = self._pages.get((source_key, page))
+        if schedule is None:
+            return
+        self._finish(schedule)
+        schedule.due = time.monotonic() + settings.PARSER_INTERVAL_SECONDS
+        self._push(schedule)
+
+    def forget(self, source_key: str, page: int):
+        """Страницы больше нет; если она снова появится в пагинации, её добавит первая страница."""
+        if page == 1:
+            self.retry_later(source_key, page)
+            return
+        schedule = self._pages.pop((source_key, page), None)
+        if schedule is not None:
+            self._finish(schedule)
+
+    def _set_last_page(self, source_key: str, last_page: int):
+        source = self._sources[source_key]
+        last_page = min(last_page, source.max_pages)
+        self._last_page[source_key] = last_page
+
+        now = time.monotonic()
+        for page in range(2, last_page + 1):
+            self._ensure_page(source_key, page, due=now)
+        for key in [key for key in self._pages if key[0] == source_key and key[1] > last_page]:
+            self._finish(self._pages.pop(key))
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        sources: Dict[str, Dict[str, Any]] = {}
+        for schedule in self._pages.values():
+            entry = sources.setdefault(schedule.source, {
+                "pages": 0, "last_page": self._last_page.get(schedule.source),
+                "fetches": 0, "changes": 0, "requests_per_hour": 0.0, "next_due_in": None
+            })
+            entry["pages"] += 1
+            entry["fetches"] += schedule.fetches
+            entry["changes"] += schedule.changes
+            if schedule.interval:
+                entry["requests_per_hour"] += 3600 / schedule.interval
+            if schedule.due != float("inf"):
+                due_in = max(0.0, schedule.due - now)
+                if entry["next_due_in"] is None or due_in < entry["next_due_in"]:
+                    entry["next_due_in"] = due_in
+
+        for entry in sources.values():
+            entry["requests_per_hour"] = round(entry["requests_per_hour"], 1)
+            if entry["next_due_in"] is not None:
+                entry["next_due_in"] = round(entry["next_due_in"], 1)
+
+        return {
+            "budget_per_hour": settings.CRAWL_REQUESTS_PER_HOUR,
+            "budget_available": round(self.budget.available, 1),
+            "in_flight": sum(1 for schedule in self._pages.values() if schedule.due == float("inf")),
+            "sources": sources
+        }
+
+
+crawl_scheduler = CrawlScheduler()
@@ -0,0 +1,118 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from core.config import settings
+from service.nats_client import nats_client
+from service.websocket_manager import manager
+
+EVENT_KINDS = ("created", "updated", "deleted")
+
+
+class EventCoalescer:
+    """
+    Собирает события по товарам за окно EVENT_COALESCE_WINDOW_MS и отправляет
+    их одним кадром products_batch в NATS и WebSocket. Внутри окна для каждого
+    товара хранится только последнее состояние. При окне 0 события уходят сразу,
+    в прежнем формате по одному.
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, Tuple[str, dict]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.EVENT_COALESCE_WINDOW_MS > 0
+
+    async def add(
+            self, kind: str, data: dict,
+            nats_message: Optional[dict] = None, ws_message: Optional[dict] = None
+    ):
+        if not self.enabled:
+            if nats_message is None and ws_message is None:
+                await self._emit({kind: [data]})
+                return
+            if nats_message is not None:
+                await nats_client.publish("items.updates", nats_message)
+            if ws_message is not None:
+                await manager.broadcast(ws_message)
+            return
+
+        self._merge(kind, data)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    def discard_pending(self):
+        self._pending.clear()
+
+    async def flush(self):
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+        batches: Dict[str, List[dict]] = {kind: [] for kind in EVENT_KINDS}
+        for kind, data in pending.values():
+            batches[kind].append(data)
+        await self._emit(batches)
+
+    async def stop(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+    def _merge(self, kind: str, data: dict):
+        product_id = data["id"]
+        current = self._pending.get(product_id)
+        if current is None:
+            self._pending[product_id] = (kind, data)
+            return
+
+        current_kind, current_data = current
+        if kind == "deleted":
+            if current_kind == "created":
+                # Клиенты ещё не видели этот товар — отправлять нечего
+                del self._pending[product_id]
+            else:
+                self._pending[product_id] = (kind, data)
+        elif current_kind == "deleted":
+            self._pending[product_id] = (kind, data)
+        else:
+            merged = {**current_data, **data}
+            # Для серии изменений цены old_price — цена до первого изменения в окне
+            if current_kind == "created":
+                merged.pop("old_price", None)
+            elif "old_price" in current_data:
+                merged["old_price"] = current_data["old_price"]
+            self._pending[product_id] = (current_kind, merged)
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(settings.EVENT_COALESCE_WINDOW_MS / 1000)
+        finally:
+            self._flush_task = None
+        await self.flush()
+
+    @staticmethod
+    async def _emit(batches: Dict[str, List[dict]]):
+        data = {kind: batches.get(kind, []) for kind in EVENT_KINDS}
+        count = sum(len(items) for items in data.values())
+        if not count:
+            return
+
+        await nats_client.publish("items.updates", {
+            "action": "batch",
+            "count": count,
+            **data
+        })
+
+        await manager.broadcast({
+            "type": "products_batch",
+            "data": {"count": count, **data}
+        })
+
+
+event_coalescer = EventCoalescer()
@@ -0,0 +1,243 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from core.config import settings
+from service.parser_service import iter_product_pages
+from service.product_service import invalidate_product_cache
+from service.sources import ParserSource
+from service.sync_service import sync_page, SyncResult
+from service.crawl_scheduler import crawl_scheduler
+from service.nats_client import nats_client
+from service.websocket_manager import manager
+from service.event_coalescer import event_coalescer
+
+
+@dataclass
+class CrawlJob:
+    id: str
+    source: str
+    start_page: int
+    end_page: Optional[int]
+    force: bool = False
+    status: str = "queued"
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    pages_done: int = 0
+    skipped_pages: int = 0
+    parsed_count: int = 0
+    created_count: int = 0
+    updated_count: int = 0
+    unchanged_count: int = 0
+    error: Optional[str] = None
+
+    @property
+    def key(self) -> Tuple[str, int, Optional[int]]:
+        return self.source, self.start_page, self.end_page
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "source": self.source,
+            "start_page": self.start_page,
+            "end_page": self.end_page,
+            "force": self.force,
+            "created_at": self.created_at.isoformat(),
+            "elapsed": round(self.elapsed, 2),
+            "pages_done": self.pages_done,
+            "skipped_pages": self.skipped_pages,
+            "parsed_count": self.parsed_count,
+            "created_count": self.created_count,
+            "updated_count": self.updated_count,
+            "unchanged_count": self.unchanged_count,
+            "error": self.error
+        }
+
+
+async def _notify_batches(sync_result: SyncResult):
+    created_batch = sync_result.created
+    updated_batch = sync_result.updated
+
+    if event_coalescer.enabled:
+        for product in created_batch:
+            await event_coalescer.add("created", product)
+        for product in updated_batch:
+            await event_coalescer.add("updated", product)
+        return
+
+    if created_batch:
+        await nats_client.publish("items.updates", {
+            "action": "batch_created",
+            "count": len(created_batch),
+            "products": created_batch[:10]
+        })
+
+        await manager.broadcast({
+            "type": "products_batch_created",
+            "data": {
+                "count": len(created_batch),
+                "products": created_batch[:10]
+            }
+        })
+
+    if updated_batch:
+        await nats_client.publish("items.updates", {
+            "action": "batch_updated",
+            "count": len(updated_batch),
+            "products": updated_batch[:10]
+        })
+
+        await manager.broadcast({
+            "type": "products_batch_updated",
+            "data": {
+                "count": len(updated_batch),
+                "products": updated_batch[:10]
+            }
+        })
+
+
+class JobManager:
+    """
+    Очередь ручных запусков парсера.
+    POST /api/tasks/run только ставит задачу; её выполняют TASK_WORKERS
+    воркеров. Повторный запрос того же диапазона страниц того же источника,
+    пока задача в очереди или выполняется, возвращает существующую задачу.
+    Ход выполнения рассылается по WebSocket кадрами job_progress.
+    """
+
+    def __init__(self):
+        self._jobs: "OrderedDict[str, CrawlJob]" = OrderedDict()
+        self._active: Dict[Tuple[str, int, Optional[int]], str] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(max(1, settings.TASK_WORKERS))
+        ]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        for job in self._jobs.values():
+            if not job.done:
+                job.status = "cancelled"
+                job.finished_at = job.finished_at or time.monotonic()
+        self._active.clear()
+
+    def submit(
+            self, source: ParserSource, start_page: int, end_page: Optional[int], force: bool = False
+    ) -> Tuple[CrawlJob, bool]:
+        """Возвращает задачу и признак того, что она создана этим вызовом."""
+        key = (source.key, start_page, end_page)
+        job_id = self._active.get(key)
+        if job_id is not None:
+            job = self._jobs[job_id]
+            job.force = job.force or force
+            return job, False
+
+        job = CrawlJob(uuid.uuid4().hex, source.key, start_page, end_page, force)
+        self._jobs[job.id] = job
+        self._active[key] = job.id
+        self._trim_history()
+        self._queue.put_nowait((job, source))
+        return job, True
+
+    def get(self, job_id: str) -> Optional[CrawlJob]:
+        return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[CrawlJob]:
+        return list(reversed(self._jobs.values()))
+
+    def _trim_history(self):
+        while len(self._jobs) > settings.TASK_JOB_HISTORY:
+            oldest_id = next((job_id for job_id, job in self._jobs.items() if job.done), None)
+            if oldest_id is None:
+                return
+            del self._jobs[oldest_id]
+
+    async def _worker(self):
+        while True:
+            job, source = await self._queue.get()
+            try:
+                await self._run(job, source)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: CrawlJob, source: ParserSource):
+        job.status = "running"
+        job.started_at = time.monotonic()
+        await self._report(job)
+
+        try:
+            pages = iter_product_pages(
+                start_page=job.start_page, end_page=job.end_page, use_cache=not job.force, source=source
+            )
+            async with aclosing(pages):
+                async for parsed_page in pages:
+                    job.pages_done += 1
+                    if parsed_page.not_modified:
+                        job.skipped_pages += 1
+                        crawl_scheduler.observe(source.key, parsed_page.page, False, parsed_page.last_page)
+                        await self._report(job)
+                        continue
+
+                    sync_result = await sync_page(parsed_page.url, parsed_page.products)
+                    if sync_result.created or sync_result.updated:
+                        invalidate_product_cache([product['id'] for product in sync_result.updated])
+
+                    await _notify_batches(sync_result)
+                    crawl_scheduler.observe(
+                        source.key, parsed_page.page,
+                        bool(sync_result.created or sync_result.updated), parsed_page.last_page
+                    )
+
+                    job.parsed_count += len(parsed_page.products)
+                    job.created_count += sync_result.created_count
+                    job.updated_count += sync_result.updated_count
+                    job.unchanged_count += sync_result.unchanged_count
+                    await self._report(job)
+
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.monotonic()
+            self._active.pop(job.key, None)
+            if job.status != "cancelled":
+                await self._report(job)
+
+    @staticmethod
+    async def _report(job: CrawlJob):
+        await manager.broadcast({
+            "type": "job_progress",
+            "data": job.to_dict()
+        })
+
+
+job_manager = JobManager()
@@ -0,0 +1,65 @@
+import asyncio
+from typing import Awaitable, Callable
+from sqlalchemy import text
+from core.config import settings
+from core.database import engine
+
+
+class LeaderElection:
+    """
+    Выбор единственного координатора среди реплик через advisory lock Postgres.
+
+    Блокировка сессионная: её держит отдельное соединение в режиме AUTOCOMMIT,
+    пока реплика остаётся лидером. Если соединение пропало, Postgres снимает
+    блокировку сам, и её забирает другая реплика. Лидер проверяет соединение
+    каждые LEADER_CHECK_INTERVAL_SECONDS и при ошибке останавливает свою работу.
+    """
+
+    def __init__(self, lock_id: int):
+        self.lock_id = lock_id
+        self.is_leader = False
+
+    async def run(self, leader_task: Callable[[], Awaitable]):
+        """Бесконечно пытается стать лидером и на время лидерства запускает leader_task."""
+        while True:
+            try:
+                await self._hold_leadership(leader_task)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Leader election error: {e}")
+            await asyncio.sleep(settings.LEADER_RETRY_SECONDS)
+
+    async def _hold_leadership(self, leader_task: Callable[[], Awaitable]):
+        async with engine.connect() as connection:
+            connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+            acquired = await connection.scalar(
+                text("SELECT pg_try_advisory_lock(:lock_id)"), {"lock_id": self.lock_id}
+            )
+            if not acquired:
+                return
+
+            print(f"Became crawl coordinator (advisory lock {self.lock_id})")
+            self.is_leader = True
+            task = asyncio.create_task(leader_task())
+            try:
+                while not task.done():
+                    await asyncio.wait({task}, timeout=settings.LEADER_CHECK_INTERVAL_SECONDS)
+                    if not task.done():
+                        await connection.scalar(text("SELECT 1"))
+                task.result()
+            finally:
+                self.is_leader = False
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                # Соединение вернётся в пул, а сессионная блокировка сама не снимется
+                try:
+                    await connection.scalar(
+                        text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": self.lock_id}
+                    )
+                except Exception:
+                    await connection.invalidate()
+                print("Crawl coordinator stepped down")
+
+
+leader_election = LeaderElection(settings.LEADER_LOCK_ID)
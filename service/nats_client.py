@@ -1,12 +1,25 @@
+import asyncio
 import json
-from typing import Optional
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
 from nats.aio.client import Client as NATS
 from core.config import settings
+from core.metrics import NATS_PUBLISH_SECONDS, NATS_FLUSH_SECONDS, NATS_QUEUE_DEPTH
 
 
 class NATSClient:
+    """
+    Публикации не отправляются по одной: они копятся в ограниченной очереди,
+    фоновый publisher забирает их пачками (до NATS_BATCH_SIZE сообщений или
+    NATS_BATCH_LINGER_MS ожидания), публикует сгруппированными по subject
+    и делает один flush на пачку.
+    """
+
     def __init__(self):
         self.nc: Optional[NATS] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._publisher_task: Optional[asyncio.Task] = None
 
     async def connect(self):
         try:
@@ -16,28 +29,107 @@ class NATSClient:
         except Exception as e:
             print(f"Failed to connect to NATS: {e}")
             self.nc = None
+            return
+
+        self._queue = asyncio.Queue(maxsize=settings.NATS_PUBLISH_QUEUE_SIZE)
+        self._publisher_task = asyncio.create_task(self._publisher_loop())
 
     async def disconnect(self):
+        if self._publisher_task:
+            # Дожидаемся отправки всего, что уже в очереди, затем останавливаем publisher
+            await self._queue.join()
+            self._publisher_task.cancel()
+            try:
+                await self._publisher_task
+            except asyncio.CancelledError:
+                pass
+            self._publisher_task = None
+            self._queue = None
+
         if self.nc:
-            await self.nc.close()
+            await self.nc.drain()
+            self.nc = None
             print("Disconnected from NATS")
 
     async def publish(self, subject: str, data: dict):
-        if self.nc:
+        if self.nc and self._queue is not None:
             try:
                 message = json.dumps(data, ensure_ascii=False).encode('utf-8')
-                await self.nc.publish(subject, message)
-                await self.nc.flush()
+                # Блокируется при заполненной очереди: backpressure для производителя
+                await self._queue.put((subject, message, time.perf_counter()))
             except Exception as e:
                 print(f"Error publishing to NATS: {e}")
 
-    async def subscribe(self, subject: str, callback):
+    async def publish_raw(self, subject: str, message: bytes):
+        """Публикация уже сериализованного сообщения."""
+        if self.nc and self._queue is not None:
+            await self._queue.put((subject, message, time.perf_counter()))
+
+    @property
+    def connected(self) -> bool:
+        return self.nc is not None and self.nc.is_connected
+
+    async def subscribe(self, subject: str, callback, queue: str = ""):
+        """queue — имя queue group: каждое сообщение получает только один подписчик группы."""
         if self.nc:
             try:
-                await self.nc.subscribe(subject, cb=callback)
-                print(f"Subscribed to NATS subject: {subject}")
+                await self.nc.subscribe(subject, queue=queue, cb=callback)
+                print(f"Subscribed to NATS subject: {subject}" + (f" (queue {queue})" if queue else ""))
             except Exception as e:
                 print(f"Error subscribing to NATS: {e}")
 
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _next_batch(self) -> List[Tuple[str, bytes, float]]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.NATS_BATCH_LINGER_MS / 1000
+
+        while len(batch) < settings.NATS_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            getter = asyncio.ensure_future(self._queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+            if not done:
+                getter.cancel()
+                break
+            batch.append(getter.result())
+
+        return batch
+
+    async def _publisher_loop(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                by_subject: Dict[str, List[bytes]] = defaultdict(list)
+                for subject, message, _ in batch:
+                    by_subject[subject].append(message)
+
+                started = time.perf_counter()
+                for subject, messages in by_subject.items():
+                    for message in messages:
+                        await self.nc.publish(subject, message)
+                await self.nc.flush()
+
+                flushed = time.perf_counter()
+                NATS_FLUSH_SECONDS.observe(flushed - started)
+                for _, _, queued_at in batch:
+                    NATS_PUBLISH_SECONDS.observe(flushed - queued_at)
+            except Exception as e:
+                print(f"Error publishing batch of {len(batch)} messages to NATS: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
 
 nats_client = NATSClient()
+NATS_QUEUE_DEPTH.set_function(lambda: nats_client.queue_depth)
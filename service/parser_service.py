@@ -1,132 +1,346 @@
 import httpx
-from bs4 import BeautifulSoup
-from typing import Optional
-import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Optional, Tuple, List
+from urllib.parse import urlsplit
 import asyncio
+import hashlib
+import time
 from core.config import settings
+from core.metrics import PAGE_FETCH_SECONDS, PAGE_PARSE_SECONDS, PAGES_TOTAL
+from service.product_extractor import extract_page
+from service.sources import ParserSource, get_source, DEFAULT_SOURCE_KEY
 
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
 
-async def parse_products(start_page: int = 1, end_page: Optional[int] = None):
-    all_products = []
-    page = start_page
-    max_pages = end_page if end_page else 100
+_executor: Optional[ProcessPoolExecutor] = None
+_page_validators: Dict[str, "PageValidators"] = {}
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+}
+
+
+class PageFetchError(Exception):
+    """Страницу не удалось получить (ошибка HTTP или сети после всех повторов) — это не «страницы нет»."""
+
+
+@dataclass
+class PageValidators:
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    last_page: Optional[int] = None
+
+
+@dataclass
+class ParsedPage:
+    page: int
+    url: str
+    products: List[dict]
+    source: str = DEFAULT_SOURCE_KEY
+    last_page: Optional[int] = None
+    not_modified: bool = False
+    validators: Optional[PageValidators] = field(default=None, repr=False)
+
+
+class HostRateLimiter:
+    """
+    Ограничивает частоту запросов к одному хосту.
+    Один экземпляр общий для всех обходов процесса, поэтому несколько
+    источников на одном сайте делят его лимит.
+    При 429/5xx интервал для хоста растёт, после успешных ответов
+    постепенно возвращается к базовому.
+    """
+
+    def __init__(self, max_interval: float = 60.0):
+        self.max_interval = max_interval
+        self._base_intervals: Dict[str, float] = {}
+        self._intervals: Dict[str, float] = {}
+        self._next_slot: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+    def set_rate(self, url: str, rate: float):
+        host = urlsplit(url).netloc
+        self._base_intervals[host] = 1.0 / rate if rate > 0 else 0.0
+
+    def _base_interval(self, host: str) -> float:
+        return self._base_intervals.get(host, 0.0)
+
+    async def wait(self, url: str):
+        host = urlsplit(url).netloc
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self._intervals.get(host, self._base_interval(host))
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def backoff(self, url: str, delay: float):
+        host = urlsplit(url).netloc
+        base_interval = self._base_interval(host)
+        interval = self._intervals.get(host, base_interval)
+        self._intervals[host] = min(max(interval * 2, base_interval, 0.5), self.max_interval)
+        loop = asyncio.get_running_loop()
+        self._next_slot[host] = max(self._next_slot.get(host, 0.0), loop.time() + delay)
+
+    def recover(self, url: str):
+        host = urlsplit(url).netloc
+        interval = self._intervals.get(host)
+        if interval is None:
+            return
+        interval = interval / 2
+        if interval <= self._base_interval(host):
+            del self._intervals[host]
+        else:
+            self._intervals[host] = interval
+
+
+_limiter = HostRateLimiter()
+
+
+def create_http_client(max_connections: int) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    return httpx.AsyncClient(timeout=30.0, follow_redirects=True, limits=limits)
+
+
+def _retry_delay(response: Optional[httpx.Response], attempt: int) -> float:
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+    return settings.PARSER_BACKOFF_BASE * (2 ** attempt)
+
+
+def _content_hash(html: str, source: ParserSource) -> str:
+    """
+    Хэш области карточек товаров: от первой карточки до блока пагинации.
+    Шапка, баннеры и счётчики вокруг каталога на результат не влияют.
+    """
+    card_marker, pagination_marker = source.hash_markers
+    start = html.find(card_marker)
+    if start == -1:
+        start = 0
+    end = html.find(pagination_marker, start)
+    if end == -1:
+        end = len(html)
+    return hashlib.blake2b(html[start:end].encode('utf-8'), digest_size=16).hexdigest()
+
+
+def reset_page_cache():
+    _page_validators.clear()
+
+
+def _get_executor() -> Optional[ProcessPoolExecutor]:
+    global _executor
+    if settings.PARSER_PROCESS_WORKERS <= 0:
+        return None
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.PARSER_PROCESS_WORKERS)
+    return _executor
 
-    print(f"Starting parser: pages {start_page} to {end_page if end_page else 'last'}")
-    print(f"{'='*60}")
 
-    async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-        while page <= max_pages:
-            try:
-                if page == 1:
-                    url = settings.PARSER_URL
-                else:
-                    url = f"{settings.PARSER_URL}&page={page}"
-
-                response = await client.get(
-                    url,
-                    headers={
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                        'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
-                        'Referer': 'https://best-magazin.com/',
-                    }
+def shutdown_parser_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _extract(html: str, source: ParserSource) -> Tuple[List[dict], Optional[int]]:
+    """
+    Разбор страницы вне event loop: в пуле процессов,
+    либо в потоке, если PARSER_PROCESS_WORKERS = 0.
+    """
+    args = (html, settings.PARSER_BACKEND, source.selectors, source.base_url, source.page_param)
+    executor = _get_executor()
+    started = time.perf_counter()
+    if executor is None:
+        products, last_page = await asyncio.to_thread(extract_page, *args)
+    else:
+        loop = asyncio.get_running_loop()
+        products, last_page = await loop.run_in_executor(executor, extract_page, *args)
+    PAGE_PARSE_SECONDS.labels(source.key).observe(time.perf_counter() - started)
+
+    for product in products:
+        product['source'] = source.key
+    return products, last_page
+
+
+async def _fetch_page(
+        client: httpx.AsyncClient, source: ParserSource, page: int, use_cache: bool = True
+) -> Optional[ParsedPage]:
+    """
+    Загружает и разбирает одну страницу.
+    Если страница не изменилась (304 или совпал хэш карточек), разбор пропускается
+    и возвращается ParsedPage с not_modified=True.
+    Возвращает None, если страница не существует (404); если получить её
+    не удалось, выбрасывает PageFetchError.
+    """
+    url = source.page_url(page)
+    cached = _page_validators.get(url) if use_cache else None
+
+    headers = {**HEADERS, 'Referer': f"{source.base_url}/"}
+    if cached and cached.etag:
+        headers['If-None-Match'] = cached.etag
+    if cached and cached.last_modified:
+        headers['If-Modified-Since'] = cached.last_modified
+
+    for attempt in range(settings.PARSER_MAX_RETRIES + 1):
+        await _limiter.wait(url)
+        response = None
+        started = time.perf_counter()
+        try:
+            response = await client.get(url, headers=headers)
+            PAGE_FETCH_SECONDS.labels(source.key, str(response.status_code)).observe(time.perf_counter() - started)
+            if response.status_code == 404:
+                print(f"\n [{source.key}] Page {page} not found (404), finished parsing")
+                PAGES_TOTAL.labels(source.key, "not_found").inc()
+                return None
+            if response.status_code == 304 and cached:
+                _limiter.recover(url)
+                PAGES_TOTAL.labels(source.key, "not_modified").inc()
+                return ParsedPage(
+                    page, url, [], source.key, cached.last_page, not_modified=True, validators=cached
                 )
+            if response.status_code not in RETRY_STATUS_CODES:
                 response.raise_for_status()
-                soup = BeautifulSoup(response.text, 'html.parser')
+                _limiter.recover(url)
 
-                product_cards = soup.select('.product-layout')
-                if not product_cards:
-                    print(f"No products found on page {page}")
-                    break
+                html = response.text
+                validators = PageValidators(
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'),
+                    content_hash=_content_hash(html, source)
+                )
+                if cached and cached.content_hash == validators.content_hash:
+                    validators.last_page = cached.last_page
+                    PAGES_TOTAL.labels(source.key, "not_modified").inc()
+                    return ParsedPage(
+                        page, url, [], source.key, cached.last_page, not_modified=True, validators=validators
+                    )
 
-                page_products = []
-                for idx, card in enumerate(product_cards, 1):
-                    try:
-                        name_elem = card.select_one('h4 a span[itemprop="name"]')
-                        if not name_elem:
-                            name_elem = card.select_one('h4 a')
-                        if not name_elem:
-                            continue
-
-                        name = name_elem.get_text(strip=True)
-
-                        link_elem = card.select_one('h4 a')
-                        product_url = link_elem.get('href', '') if link_elem else ''
-                        if product_url and not product_url.startswith('http'):
-                            product_url = f"https://best-magazin.com{product_url}"
-
-                        image_elem = card.select_one('img[itemprop="image"]')
-                        if not image_elem:
-                            image_elem = card.select_one('img')
-                        image_url = image_elem.get('src', '') if image_elem else None
-                        if image_url and not image_url.startswith('http'):
-                            image_url = f"https://best-magazin.com{image_url}"
-
-                        price_meta = card.select_one('meta[itemprop="price"]')
-                        if not price_meta:
-                            price_elem = card.select_one('.price-new')
-                            if price_elem:
-                                price_text = price_elem.get_text(strip=True)
-                                price_numbers = re.findall(r'\d+', price_text)
-                                price = float(''.join(price_numbers)) if price_numbers else 0
-                            else:
-                                continue
-                        else:
-                            price = float(price_meta.get('content', 0))
-
-                        if price == 0:
-                            continue
-
-                        old_price = None
-                        old_price_elem = card.select_one('.price-old')
-                        if old_price_elem:
-                            old_price_text = old_price_elem.get_text(strip=True)
-                            old_price_numbers = re.findall(r'\d+', old_price_text)
-                            if old_price_numbers:
-                                old_price = float(''.join(old_price_numbers))
-
-                        buy_button = card.select_one('.cart a')
-                        availability = 'available' if buy_button else 'out_of_stock'
-
-                        page_products.append({
-                            'name': name,
-                            'price': price,
-                            'old_price': old_price,
-                            'url': product_url,
-                            'image_url': image_url,
-                            'availability': availability
-                        })
-
-                    except Exception as e:
-                        print(f"Error parsing card {idx}: {e}")
-                        continue
-
-                all_products.extend(page_products)
-
-                if end_page and page >= end_page:
-                    print(f"Reached target page {end_page}, stopping")
-                    break
+                products, last_page = await _extract(html, source)
+                validators.last_page = last_page
+                PAGES_TOTAL.labels(source.key, "parsed").inc()
+                return ParsedPage(page, url, products, source.key, last_page, validators=validators)
+            print(f"\n HTTP error {response.status_code} on page {page}, retry {attempt + 1}")
+        except httpx.HTTPStatusError as e:
+            print(f"\n HTTP error {e.response.status_code} on page {page}")
+            PAGES_TOTAL.labels(source.key, "failed").inc()
+            raise PageFetchError(f"HTTP {e.response.status_code} on {url}") from e
+        except httpx.TransportError as e:
+            PAGE_FETCH_SECONDS.labels(source.key, "error").observe(time.perf_counter() - started)
+            print(f"\n Error on page {page}: {type(e).__name__}: {e}, retry {attempt + 1}")
+
+        delay = _retry_delay(response, attempt)
+        _limiter.backoff(url, delay)
+
+    print(f"\n Giving up on page {page} after {settings.PARSER_MAX_RETRIES} retries")
+    PAGES_TOTAL.labels(source.key, "failed").inc()
+    raise PageFetchError(f"Giving up on {url} after {settings.PARSER_MAX_RETRIES} retries")
+
+
+def remember_page(parsed_page: ParsedPage):
+    """Сохраняет валидаторы страницы; вызывать после успешной синхронизации с БД."""
+    if parsed_page.validators is not None:
+        _page_validators[parsed_page.url] = parsed_page.validators
 
-                page += 1
-                if page <= max_pages:
-                    delay = getattr(settings, 'PARSER_PAGE_DELAY', 2)
-                    await asyncio.sleep(delay)
 
-            except httpx.HTTPStatusError as e:
-                if e.response.status_code == 404:
-                    print(f"\n Page {page} not found (404), finished parsing")
+async def fetch_page(
+        source: ParserSource, page: int, client: httpx.AsyncClient, use_cache: bool = True
+) -> Optional[ParsedPage]:
+    """
+    Одна страница источника вне последовательного обхода.
+    None — страницы нет: 404 или пустой каталог. Ошибка загрузки —
+    PageFetchError: страница, скорее всего, есть, и её стоит повторить.
+    """
+    # Фоновый обход и воркеры других реплик не проходят через iter_product_pages
+    _limiter.set_rate(source.start_url, source.rate_limit)
+    use_cache = use_cache and settings.PARSER_CONDITIONAL_REQUESTS
+    parsed_page = await _fetch_page(client, source, page, use_cache)
+    if parsed_page is None or (not parsed_page.products and not parsed_page.not_modified):
+        return None
+    return parsed_page
+
+
+async def iter_product_pages(
+        start_page: int = 1,
+        end_page: Optional[int] = None,
+        use_cache: bool = True,
+        source: Optional[ParserSource] = None,
+        client: Optional[httpx.AsyncClient] = None
+) -> AsyncIterator[ParsedPage]:
+    """
+    Обходит страницы источника через ограниченное окно параллельных загрузок
+    и отдаёт каждую страницу сразу после разбора, строго в порядке номеров.
+    Первая страница загружается отдельно: по её пагинации определяется последняя.
+
+    Валидаторы страницы (ETag, Last-Modified, хэш карточек) запоминаются только
+    после того, как потребитель обработал страницу и запросил следующую:
+    если синхронизация с БД упала, страница будет разобрана заново.
+
+    404 или пустая страница завершают обход; ошибка загрузки выбрасывается
+    наружу как PageFetchError, чтобы задача обхода не считалась завершённой.
+
+    client позволяет нескольким обходам делить один пул соединений.
+    """
+    source = source or get_source(DEFAULT_SOURCE_KEY)
+    use_cache = use_cache and settings.PARSER_CONDITIONAL_REQUESTS
+    max_page = min(end_page, source.max_pages) if end_page else source.max_pages
+    concurrency = max(1, source.concurrency)
+    _limiter.set_rate(source.start_url, source.rate_limit)
+
+    print(f"Starting parser [{source.key}]: pages {start_page} to {end_page if end_page else 'last'}")
+    print(f"{'='*60}")
+
+    async with AsyncExitStack() as stack:
+        if client is None:
+            client = await stack.enter_async_context(create_http_client(concurrency))
+
+        first = await _fetch_page(client, source, start_page, use_cache)
+        if first is None:
+            return
+
+        if not first.products and not first.not_modified:
+            print(f"[{source.key}] No products found on page {start_page}")
+            return
+        yield first
+        remember_page(first)
+
+        if first.last_page:
+            max_page = min(max_page, first.last_page)
+
+        pending: deque = deque()
+        next_page = start_page + 1
+        try:
+            while True:
+                while len(pending) < concurrency and next_page <= max_page:
+                    pending.append((
+                        next_page,
+                        asyncio.create_task(_fetch_page(client, source, next_page, use_cache))
+                    ))
+                    next_page += 1
+                if not pending:
                     break
-                else:
-                    print(f"\n HTTP error {e.response.status_code} on page {page}")
+
+                page, task = pending.popleft()
+                parsed_page = await task
+                if parsed_page is None:
                     break
-            except Exception as e:
-                print(f"\n Error on page {page}: {type(e).__name__}: {e}")
-                import traceback
-                traceback.print_exc()
-                break
 
-    # print(f"\n{'='*60}")
-    # print(f"📊 Pages processed: {page - start_page + 1}")
-    # print(f"📦 Total products: {len(all_products)}")
+                if not parsed_page.products and not parsed_page.not_modified:
+                    print(f"[{source.key}] No products found on page {page}")
+                    break
+                yield parsed_page
+                remember_page(parsed_page)
+        finally:
+            for _, task in pending:
+                task.cancel()
+            await asyncio.gather(*(task for _, task in pending), return_exceptions=True)
 
-    return all_products
@@ -0,0 +1,57 @@
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import select, insert, func, literal_column
+from sqlalchemy.dialects.postgresql import array_agg, aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.price_history import PriceHistory
+from schemas.price_history import PriceHistoryBucket
+
+INTERVALS = ("minute", "hour", "day", "week", "month")
+
+
+async def record_prices(session: AsyncSession, points: List[dict]):
+    """
+    Пишет точки истории одной пачкой: [{"product_id": ..., "price": ...}, ...].
+    Вызывается только для новых товаров и реально изменившихся цен.
+    """
+    if points:
+        await session.execute(insert(PriceHistory), points)
+
+
+async def get_price_buckets(
+        db: AsyncSession,
+        product_id: int,
+        interval: str = "day",
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+) -> List[PriceHistoryBucket]:
+    """
+    Прореживание истории по интервалам date_trunc: min/max/последняя цена в каждом.
+    Запрос идёт по индексу (product_id, ts).
+    """
+    if interval not in INTERVALS:
+        raise ValueError(f"Unknown interval: {interval}")
+
+    # Интервал подставляется литералом: одинаковое выражение нужно в SELECT и GROUP BY
+    bucket = func.date_trunc(literal_column(f"'{interval}'"), PriceHistory.ts).label("bucket")
+    last_price = array_agg(aggregate_order_by(PriceHistory.price, PriceHistory.ts.desc()))[1]
+
+    stmt = (
+        select(
+            bucket,
+            func.min(PriceHistory.price).label("min_price"),
+            func.max(PriceHistory.price).label("max_price"),
+            last_price.label("last_price"),
+            func.count().label("samples")
+        )
+        .where(PriceHistory.product_id == product_id)
+        .group_by(bucket)
+        .order_by(bucket)
+    )
+    if since:
+        stmt = stmt.where(PriceHistory.ts >= since)
+    if until:
+        stmt = stmt.where(PriceHistory.ts < until)
+
+    result = await db.execute(stmt)
+    return [PriceHistoryBucket(**row._mapping) for row in result]
@@ -0,0 +1,192 @@
+"""
+Разбор HTML страницы каталога в список товаров.
+
+Модуль намеренно не зависит от настроек приложения и event loop:
+extract_page — чистая функция, которую можно выполнять в ProcessPoolExecutor.
+Скомпилированные селекторы кэшируются на уровне процесса.
+"""
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+BACKENDS = ("lxml", "bs4", "html.parser")
+
+BASE_URL = "https://best-magazin.com"
+
+SELECTORS = {
+    'card': '.product-layout',
+    'name': 'h4 a span[itemprop="name"]',
+    'name_fallback': 'h4 a',
+    'link': 'h4 a',
+    'image': 'img[itemprop="image"]',
+    'image_fallback': 'img',
+    'price_meta': 'meta[itemprop="price"]',
+    'price_new': '.price-new',
+    'price_old': '.price-old',
+    'buy_button': '.cart a',
+    'pagination': '.pagination a[href]',
+}
+
+_DIGITS_RE = re.compile(r'\d+')
+_TOTAL_PAGES_RE = re.compile(r'всего\s+(\d+)\s+страниц')
+
+
+@lru_cache(maxsize=None)
+def _page_param_re(page_param: str):
+    return re.compile(rf'[?&](?:amp;)?{re.escape(page_param)}=(\d+)')
+
+
+@lru_cache(maxsize=None)
+def _lxml_selector(css: str):
+    from lxml.cssselect import CSSSelector
+    return CSSSelector(css)
+
+
+@lru_cache(maxsize=None)
+def _soup_selector(css: str):
+    import soupsieve
+    return soupsieve.compile(css)
+
+
+def _lxml_backend() -> Tuple[Callable, Callable, Callable, Callable]:
+    def parse(html: str):
+        from lxml import html as lxml_html
+        return lxml_html.document_fromstring(html)
+
+    def select(elem, css: str) -> list:
+        return _lxml_selector(css)(elem)
+
+    def text(elem) -> str:
+        return ''.join(part.strip() for part in elem.itertext())
+
+    def attr(elem, name: str, default=None):
+        return elem.get(name, default)
+
+    return parse, select, text, attr
+
+
+def _soup_backend(features: str) -> Tuple[Callable, Callable, Callable, Callable]:
+    def parse(html: str):
+        from bs4 import BeautifulSoup
+        return BeautifulSoup(html, features)
+
+    def select(elem, css: str) -> list:
+        return _soup_selector(css).select(elem)
+
+    def text(elem) -> str:
+        return elem.get_text(strip=True)
+
+    def attr(elem, name: str, default=None):
+        return elem.get(name, default)
+
+    return parse, select, text, attr
+
+
+def _get_backend(backend: str):
+    if backend == "lxml":
+        return _lxml_backend()
+    if backend == "bs4":
+        return _soup_backend("lxml")
+    if backend == "html.parser":
+        return _soup_backend("html.parser")
+    raise ValueError(f"Unknown parser backend: {backend}. Expected one of {BACKENDS}")
+
+
+def _absolute(url: Optional[str], base_url: str) -> Optional[str]:
+    if url and not url.startswith('http'):
+        return f"{base_url}{url}"
+    return url
+
+
+def _number(value: str) -> Optional[float]:
+    numbers = _DIGITS_RE.findall(value)
+    return float(''.join(numbers)) if numbers else None
+
+
+def _parse_last_page(html: str, links: List[str], page_param: str) -> Optional[int]:
+    page_re = _page_param_re(page_param)
+    pages = [int(match.group(1)) for href in links if (match := page_re.search(href))]
+    if pages:
+        return max(pages)
+
+    total_match = _TOTAL_PAGES_RE.search(html)
+    if total_match:
+        return int(total_match.group(1))
+
+    return None
+
+
+def extract_page(
+        html: str, backend: str = "lxml",
+        selectors: Optional[Dict[str, str]] = None, base_url: str = BASE_URL, page_param: str = "page"
+) -> Tuple[List[dict], Optional[int]]:
+    """
+    Возвращает товары со страницы и номер последней страницы из пагинации
+    (None, если пагинации нет). selectors по ключам SELECTORS задают разметку
+    конкретного источника.
+    """
+    selectors = selectors or SELECTORS
+    parse, select, text, attr = _get_backend(backend)
+    root = parse(html)
+
+    def first(elem, key: str):
+        found = select(elem, selectors[key])
+        return found[0] if found else None
+
+    product_cards = select(root, selectors['card'])
+    if not product_cards:
+        return [], None
+
+    page_products = []
+    for idx, card in enumerate(product_cards, 1):
+        try:
+            name_elem = first(card, 'name')
+            if name_elem is None:
+                name_elem = first(card, 'name_fallback')
+            if name_elem is None:
+                continue
+
+            name = text(name_elem)
+
+            link_elem = first(card, 'link')
+            product_url = _absolute(attr(link_elem, 'href', '') if link_elem is not None else '', base_url)
+
+            image_elem = first(card, 'image')
+            if image_elem is None:
+                image_elem = first(card, 'image_fallback')
+            image_url = _absolute(attr(image_elem, 'src', '') if image_elem is not None else None, base_url)
+
+            price_meta = first(card, 'price_meta')
+            if price_meta is None:
+                price_elem = first(card, 'price_new')
+                if price_elem is None:
+                    continue
+                price = _number(text(price_elem)) or 0
+            else:
+                price = float(attr(price_meta, 'content', 0))
+
+            if price == 0:
+                continue
+
+            old_price = None
+            old_price_elem = first(card, 'price_old')
+            if old_price_elem is not None:
+                old_price = _number(text(old_price_elem))
+
+            availability = 'available' if first(card, 'buy_button') is not None else 'out_of_stock'
+
+            page_products.append({
+                'name': name,
+                'price': price,
+                'old_price': old_price,
+                'url': product_url,
+                'image_url': image_url,
+                'availability': availability
+            })
+
+        except Exception as e:
+            print(f"Error parsing card {idx}: {e}")
+            continue
+
+    links = [attr(link, 'href', '') for link in select(root, selectors['pagination'])]
+    return page_products, _parse_last_page(html, links, page_param)
@@ -0,0 +1,80 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+from sqlalchemy import select
+from core.config import settings
+from core.database import AsyncSessionLocal
+from models.product import Product
+
+
+@dataclass(frozen=True)
+class IndexEntry:
+    id: int
+    price: float
+    availability: Optional[str]
+
+
+class ProductIndex:
+    """
+    Процессный индекс URL -> (id, price, availability) для синхронизации:
+    товары, у которых не изменились ни цена, ни наличие, отсеиваются
+    без обращения к БД. Прогревается при старте и обновляется каждой записью.
+
+    Индекс — только ускорение: промах или удалённая запись означают
+    обычный поиск в БД, поэтому при сомнениях запись просто удаляется.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, IndexEntry] = {}
+        self._urls_by_id: Dict[int, str] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return settings.PRODUCT_INDEX_ENABLED
+
+    async def warm(self):
+        if not self.enabled:
+            return
+
+        self.clear()
+        stmt = (
+            select(Product.id, Product.url, Product.price, Product.availability)
+            .where(Product.url.is_not(None))
+            .execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+        )
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(stmt)
+            async for rows in result.partitions():
+                for row in rows:
+                    self.put(row.url, row.id, row.price, row.availability)
+        print(f"Product index warmed: {len(self._entries)} URLs")
+
+    def get(self, url: str) -> Optional[IndexEntry]:
+        return self._entries.get(url)
+
+    def put(self, url: Optional[str], product_id: int, price: float, availability: Optional[str]):
+        if not self.enabled:
+            return
+        old_url = self._urls_by_id.get(product_id)
+        if old_url is not None and old_url != url:
+            self._entries.pop(old_url, None)
+        if url is None:
+            self._urls_by_id.pop(product_id, None)
+            return
+        self._entries[url] = IndexEntry(product_id, price, availability)
+        self._urls_by_id[product_id] = url
+
+    def discard(self, product_ids: Iterable[int]):
+        for product_id in product_ids:
+            url = self._urls_by_id.pop(product_id, None)
+            if url is not None:
+                self._entries.pop(url, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._urls_by_id.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+product_index = ProductIndex()
@@ -1,18 +1,306 @@
+import base64
+import csv
+import io
+import json
+import time
+import orjson
+from collections import OrderedDict
+from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
-from typing import List
+from sqlalchemy import select, delete, update, tuple_
+from sqlalchemy.exc import IntegrityError
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
 from fastapi import HTTPException
-from models.product import Product
-from schemas.product import ProductCreate, ProductUpdate
+from core.config import settings
+from core.database import AsyncSessionLocal
+from models.product import Product, changed_at, normalize_url
+from schemas.product import ProductCreate, ProductUpdate, ProductResponse, ProductBulkFilter, ProductBulkUpdate
 from service.nats_client import nats_client
-from service.websocket_manager import manager
+from service.websocket_manager import manager, Subscription
+from service.parser_service import reset_page_cache
+from service.event_coalescer import event_coalescer
+from service.price_history_service import record_prices
+from service.product_index import product_index
+
+
+_MISSING = object()
+
+# Порядок полей совпадает с ProductResponse, чтобы быстрый путь давал тот же JSON
+LISTING_FIELDS = list(ProductResponse.model_fields.keys())
+LISTING_COLUMNS = [getattr(Product, name) for name in LISTING_FIELDS]
+
+
+class TTLCache:
+    """LRU-кэш с ограничением по времени жизни записей."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return _MISSING
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
 
 
-async def get_products(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[Product]:
-    result = await db.execute(
-        select(Product).offset(skip).limit(limit)
-    )
-    return result.scalars().all()
+_item_cache = TTLCache(settings.PRODUCT_CACHE_MAX_ITEMS, settings.PRODUCT_CACHE_TTL_SECONDS)
+_list_cache = TTLCache(settings.PRODUCT_CACHE_MAX_LISTS, settings.PRODUCT_CACHE_TTL_SECONDS)
+# Увеличивается при каждой инвалидации: результат запроса, начатого до записи,
+# не должен попасть в кэш после неё
+_cache_generation = 0
+
+
+def invalidate_product_cache(product_ids: Optional[Iterable[int]] = None):
+    global _cache_generation
+    _cache_generation += 1
+
+    if product_ids is None:
+        _item_cache.clear()
+    else:
+        for product_id in product_ids:
+            _item_cache.pop(product_id)
+    # Любое изменение может сдвинуть состав и порядок страниц списка
+    _list_cache.clear()
+
+
+def _invalidate_from_remote(message: dict):
+    """
+    Товары изменила другая реплика: её события сбрасывают и здешний кэш чтения.
+    После удалений сбрасываются и валидаторы страниц: страницы из очереди
+    обхода могут достаться этой реплике, и неизменившиеся пропускались бы.
+    """
+    message_type = message.get("type")
+    data = message.get("data") or {}
+    if message_type in ("product_deleted", "all_products_deleted") or (
+            message_type == "products_batch" and data.get("deleted")):
+        reset_page_cache()
+
+    if message_type in ("product_updated", "product_deleted"):
+        invalidate_product_cache([data["id"]])
+        product_index.discard([data["id"]])
+    elif message_type == "products_batch":
+        changed_ids = [item["id"] for item in data["updated"] + data["deleted"]]
+        invalidate_product_cache(changed_ids)
+        product_index.discard(changed_ids)
+    elif message_type in ("product_created", "products_batch_created"):
+        invalidate_product_cache([])
+    elif message_type in ("products_batch_updated", "all_products_deleted"):
+        # В старом формате пачки только первые 10 товаров
+        invalidate_product_cache()
+        product_index.clear()
+
+
+manager.add_remote_listener(_invalidate_from_remote)
+
+
+async def _snapshot_products(subscription: Optional[Subscription]) -> bytes:
+    """Снимок каталога для resync WebSocket-клиента с учётом его подписки."""
+    stmt = select(*LISTING_COLUMNS).order_by(Product.id)
+    if subscription is not None:
+        if subscription.product_ids:
+            stmt = stmt.where(Product.id.in_(subscription.product_ids))
+        if subscription.sources:
+            stmt = stmt.where(Product.source.in_(subscription.sources))
+        if subscription.min_price is not None:
+            stmt = stmt.where(Product.price >= subscription.min_price)
+        if subscription.max_price is not None:
+            stmt = stmt.where(Product.price <= subscription.max_price)
+
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(stmt)).all()
+    return serialize_product_rows(rows)
+
+
+manager.set_snapshot_provider(_snapshot_products)
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    return {
+        "items": _item_cache.stats(),
+        "lists": _list_cache.stats(),
+        "url_index": len(product_index),
+        "ttl_seconds": settings.PRODUCT_CACHE_TTL_SECONDS
+    }
+
+
+def encode_cursor(product: Product, sort: str) -> str:
+    values = [product.price, product.id] if sort == "price" else [product.id]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if not isinstance(values, list) or len(values) != (2 if sort == "price" else 1):
+        raise HTTPException(status_code=400, detail="Cursor does not match sort order")
+
+    # bool — подкласс int, но в курсоре ему не место
+    *prices, product_id = values
+    valid_id = isinstance(product_id, int) and not isinstance(product_id, bool)
+    valid_prices = all(isinstance(price, (int, float)) and not isinstance(price, bool) for price in prices)
+    if not (valid_id and valid_prices):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def _name_prefix_condition(prefix: str):
+    # Готовый шаблон без конкатенации в SQL, чтобы работал индекс text_pattern_ops
+    pattern = prefix.replace("/", "//").replace("%", "/%").replace("_", "/_")
+    return Product.name.like(f"{pattern}%", escape="/")
+
+
+def _apply_listing(
+        stmt,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        sort: str = "id",
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        availability: Optional[str] = None,
+        name_prefix: Optional[str] = None,
+        updated_since: Optional[datetime] = None,
+        source: Optional[str] = None
+):
+    """
+    Keyset-пагинация по (id) или (price, id): страница начинается строго после
+    курсора, поэтому время ответа не зависит от глубины. skip оставлен для
+    совместимости и используется только без курсора.
+    Выбирается limit + 1 строк, чтобы понять, есть ли следующая страница.
+    """
+    if min_price is not None:
+        stmt = stmt.where(Product.price >= min_price)
+    if max_price is not None:
+        stmt = stmt.where(Product.price <= max_price)
+    if availability:
+        stmt = stmt.where(Product.availability == availability)
+    if name_prefix:
+        stmt = stmt.where(_name_prefix_condition(name_prefix))
+    if updated_since:
+        stmt = stmt.where(changed_at >= updated_since)
+    if source:
+        stmt = stmt.where(Product.source == source)
+
+    if sort == "price":
+        stmt = stmt.order_by(Product.price, Product.id)
+        if cursor:
+            price, product_id = decode_cursor(cursor, sort)
+            stmt = stmt.where(tuple_(Product.price, Product.id) > tuple_(price, product_id))
+    else:
+        stmt = stmt.order_by(Product.id)
+        if cursor:
+            (product_id,) = decode_cursor(cursor, sort)
+            stmt = stmt.where(Product.id > product_id)
+
+    if skip and not cursor:
+        stmt = stmt.offset(skip)
+
+    return stmt.limit(limit + 1)
+
+
+def _split_page(items: list, limit: int, sort: str) -> Tuple[list, Optional[str]]:
+    if len(items) > limit:
+        items = items[:limit]
+        return items, encode_cursor(items[-1], sort)
+    return items, None
+
+
+async def get_products(db: AsyncSession, limit: int = 100, sort: str = "id", **params) -> Tuple[List[Product], Optional[str]]:
+    """Возвращает товары и курсор следующей страницы (None, если она последняя)."""
+    result = await db.execute(_apply_listing(select(Product), limit=limit, sort=sort, **params))
+    return _split_page(list(result.scalars().all()), limit, sort)
+
+
+async def get_product_rows(db: AsyncSession, limit: int = 100, sort: str = "id", **params) -> Tuple[list, Optional[str]]:
+    """То же, что get_products, но Core-строками только нужных колонок, без ORM-объектов."""
+    result = await db.execute(_apply_listing(select(*LISTING_COLUMNS), limit=limit, sort=sort, **params))
+    return _split_page(result.all(), limit, sort)
+
+
+def serialize_product_rows(rows: list, format: str = "json", next_cursor: Optional[str] = None) -> bytes:
+    """
+    Сериализует строки напрямую в байты, минуя валидацию ProductResponse.
+    json совпадает по формату с ответом через response_model;
+    columnar — компактный вариант: имена колонок один раз и массивы значений.
+    """
+    if format == "columnar":
+        return orjson.dumps(
+            {"columns": LISTING_FIELDS, "rows": [tuple(row) for row in rows], "next_cursor": next_cursor},
+            option=orjson.OPT_UTC_Z
+        )
+    return orjson.dumps([dict(zip(LISTING_FIELDS, row)) for row in rows], option=orjson.OPT_UTC_Z)
+
+
+async def export_products(format: str = "ndjson", since: Optional[datetime] = None) -> AsyncIterator[bytes]:
+    """
+    Потоковая выгрузка каталога серверным курсором: в памяти одновременно
+    находится не больше EXPORT_BATCH_SIZE строк, сколько бы товаров ни было.
+    С since выгружаются только товары, изменённые начиная с этого момента.
+    Сессия своя: генератор живёт дольше обработчика запроса.
+    """
+    stmt = select(*LISTING_COLUMNS).order_by(Product.id)
+    if since:
+        stmt = stmt.where(changed_at >= since)
+    stmt = stmt.execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(LISTING_FIELDS)
+        yield buffer.getvalue().encode("utf-8")
+
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(stmt)
+        async for rows in result.partitions():
+            if format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerows(
+                    [value.isoformat() if isinstance(value, datetime) else value for value in row]
+                    for row in rows
+                )
+                yield buffer.getvalue().encode("utf-8")
+            else:
+                yield b"".join(
+                    orjson.dumps(dict(zip(LISTING_FIELDS, row)), option=orjson.OPT_UTC_Z) + b"\n"
+                    for row in rows
+                )
 
 
 async def get_product_by_id(db: AsyncSession, product_id: int) -> Product:
@@ -26,13 +314,57 @@ async def get_product_by_id(db: AsyncSession, product_id: int) -> Product:
     return product
 
 
+async def list_products(db: AsyncSession, format: str = "json", **params) -> Tuple[bytes, Optional[str]]:
+    """
+    Кэширующее чтение страницы для GET /api/items.
+    В кэше лежит уже сериализованное тело ответа.
+    """
+    key = (format, *sorted(params.items()))
+    cached = _list_cache.get(key)
+    if cached is not _MISSING:
+        return cached
+
+    generation = _cache_generation
+    rows, next_cursor = await get_product_rows(db, **params)
+    page = (serialize_product_rows(rows, format, next_cursor), next_cursor)
+    if generation == _cache_generation:
+        _list_cache.set(key, page)
+    return page
+
+
+async def get_product(db: AsyncSession, product_id: int) -> ProductResponse:
+    """Кэширующее чтение одного товара для GET /api/items/{id}."""
+    cached = _item_cache.get(product_id)
+    if cached is not _MISSING:
+        return cached
+
+    generation = _cache_generation
+    product = ProductResponse.model_validate(await get_product_by_id(db, product_id))
+    if generation == _cache_generation:
+        _item_cache.set(product_id, product)
+    return product
+
+
+async def _commit_unique_url(db: AsyncSession, flush_only: bool = False):
+    try:
+        await (db.flush() if flush_only else db.commit())
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Product with this URL already exists")
+
+
 async def create_product(db: AsyncSession, product_data: ProductCreate) -> Product:
-    new_product = Product(**product_data.model_dump())
+    new_product = Product(**{**product_data.model_dump(), "url": normalize_url(product_data.url)})
 
     db.add(new_product)
-    await db.commit()
+    # Первая точка истории, как у товаров из парсера; id нужен до коммита
+    await _commit_unique_url(db, flush_only=True)
+    await record_prices(db, [{"product_id": new_product.id, "price": new_product.price}])
+    await _commit_unique_url(db)
     await db.refresh(new_product)
 
+    invalidate_product_cache([new_product.id])
+    product_index.put(new_product.url, new_product.id, new_product.price, new_product.availability)
     await _notify_product_created(new_product)
 
     return new_product
@@ -42,12 +374,20 @@ async def update_product(db: AsyncSession,product_id: int,product_data: ProductU
     product = await get_product_by_id(db, product_id)
 
     update_data = product_data.model_dump(exclude_unset=True)
+    if "url" in update_data:
+        update_data["url"] = normalize_url(update_data["url"])
+    price_changed = "price" in update_data and update_data["price"] != product.price
     for field, value in update_data.items():
         setattr(product, field, value)
 
-    await db.commit()
+    if price_changed:
+        await record_prices(db, [{"product_id": product.id, "price": product.price}])
+
+    await _commit_unique_url(db)
     await db.refresh(product)
 
+    invalidate_product_cache([product.id])
+    product_index.put(product.url, product.id, product.price, product.availability)
     await _notify_product_updated(product)
 
     return product
@@ -59,79 +399,162 @@ async def delete_product(db: AsyncSession,product_id: int):
     await db.delete(product)
     await db.commit()
 
-    await _notify_product_deleted(product_id)
+    # Страница товара не знает, какой из карточек у неё не стало: без сброса
+    # валидаторов она будет пропускаться, пока не изменится, и товар не вернётся
+    reset_page_cache()
+    invalidate_product_cache([product_id])
+    product_index.discard([product_id])
+    await _notify_product_deleted(product_id, product.source)
+
+
+def _bulk_conditions(bulk_filter: ProductBulkFilter) -> list:
+    conditions = []
+    if bulk_filter.ids:
+        conditions.append(Product.id.in_(bulk_filter.ids))
+    if bulk_filter.availability:
+        conditions.append(Product.availability == bulk_filter.availability)
+    if bulk_filter.min_price is not None:
+        conditions.append(Product.price >= bulk_filter.min_price)
+    if bulk_filter.max_price is not None:
+        conditions.append(Product.price <= bulk_filter.max_price)
+    if bulk_filter.name_prefix:
+        conditions.append(_name_prefix_condition(bulk_filter.name_prefix))
+    if bulk_filter.updated_before:
+        conditions.append(changed_at < bulk_filter.updated_before)
+    if bulk_filter.source:
+        conditions.append(Product.source == bulk_filter.source)
+    return conditions
 
 
 async def delete_all_products(db: AsyncSession) -> int:
-    count_result = await db.execute(select(Product))
-    products_count = len(count_result.scalars().all())
+    result = await db.execute(delete(Product))
+    await db.commit()
 
+    products_count = result.rowcount
     if products_count == 0:
         return 0
 
-    await db.execute(delete(Product))
-    await db.commit()
+    # Иначе неизменившиеся страницы каталога будут пропускаться и таблица не заполнится заново
+    reset_page_cache()
+    invalidate_product_cache()
+    product_index.clear()
 
     await _notify_all_products_deleted(products_count)
 
     return products_count
 
 
-async def _notify_product_created(product: Product):
-    message = {
-        "action": "created",
-        "product_id": product.id,
-        "product_name": product.name,
-        "price": product.price
-    }
+async def delete_products(db: AsyncSession, bulk_filter: ProductBulkFilter) -> int:
+    """Удаление по фильтру одним DELETE ... RETURNING id."""
+    if bulk_filter.is_empty():
+        return await delete_all_products(db)
 
-    await nats_client.publish("items.updates", message)
+    result = await db.execute(
+        delete(Product).where(*_bulk_conditions(bulk_filter)).returning(Product.id, Product.source)
+    )
+    deleted_rows = result.all()
+    await db.commit()
 
-    await manager.broadcast({
-        "type": "product_created",
-        "data": {
-            "id": product.id,
-            "name": product.name,
-            "price": product.price
+    if not deleted_rows:
+        return 0
+
+    reset_page_cache()
+    invalidate_product_cache([row.id for row in deleted_rows])
+    product_index.discard([row.id for row in deleted_rows])
+
+    for row in deleted_rows:
+        await _notify_product_deleted(row.id, row.source)
+
+    return len(deleted_rows)
+
+
+async def bulk_update_products(db: AsyncSession, bulk_update: ProductBulkUpdate) -> int:
+    """
+    Массовое изменение одним UPDATE ... RETURNING, например
+    пометить out_of_stock все товары, не обновлявшиеся с заданного момента.
+    """
+    values = bulk_update.model_dump(exclude={"filter", "all"}, exclude_none=True)
+    if not values:
+        return 0
+
+    result = await db.execute(
+        update(Product)
+        .where(*_bulk_conditions(bulk_update.filter))
+        .values(**values)
+        .returning(Product.id, Product.name, Product.price, Product.availability, Product.source)
+    )
+    updated_rows = result.all()
+    await db.commit()
+
+    invalidate_product_cache([row.id for row in updated_rows])
+    product_index.discard([row.id for row in updated_rows])
+
+    for row in updated_rows:
+        data = {
+            "id": row.id, "name": row.name, "price": row.price,
+            "availability": row.availability, "source": row.source
         }
-    })
+        await event_coalescer.add("updated", data, ws_message={"type": "product_updated", "data": data})
 
+    return len(updated_rows)
 
-async def _notify_product_updated(product: Product):
-    message = {
-        "action": "updated",
-        "product_id": product.id,
-        "product_name": product.name,
-        "price": product.price
-    }
 
-    await nats_client.publish("items.updates", message)
+async def _notify_product_created(product: Product):
+    data = {
+        "id": product.id,
+        "name": product.name,
+        "price": product.price,
+        "source": product.source
+    }
 
-    await manager.broadcast({
-        "type": "product_updated",
-        "data": {
-            "id": product.id,
-            "name": product.name,
+    await event_coalescer.add(
+        "created", data,
+        nats_message={
+            "action": "created",
+            "product_id": product.id,
+            "product_name": product.name,
             "price": product.price
-        }
-    })
+        },
+        ws_message={"type": "product_created", "data": data}
+    )
 
 
-async def _notify_product_deleted(product_id: int):
-    message = {
-        "action": "deleted",
-        "product_id": product_id
+async def _notify_product_updated(product: Product):
+    data = {
+        "id": product.id,
+        "name": product.name,
+        "price": product.price,
+        "source": product.source
     }
 
-    await nats_client.publish("items.updates", message)
+    await event_coalescer.add(
+        "updated", data,
+        nats_message={
+            "action": "updated",
+            "product_id": product.id,
+            "product_name": product.name,
+            "price": product.price
+        },
+        ws_message={"type": "product_updated", "data": data}
+    )
 
-    await manager.broadcast({
-        "type": "product_deleted",
-        "data": {"id": product_id}
-    })
+
+async def _notify_product_deleted(product_id: int, source: Optional[str] = None):
+    data = {"id": product_id, "source": source}
+    await event_coalescer.add(
+        "deleted", data,
+        nats_message={
+            "action": "deleted",
+            "product_id": product_id
+        },
+        ws_message={"type": "product_deleted", "data": data}
+    )
 
 
 async def _notify_all_products_deleted(count: int):
+    # События по отдельным товарам после удаления всех уже не имеют смысла
+    event_coalescer.discard_pending()
+
     message = {
         "action": "deleted_all",
         "count": count
@@ -145,4 +568,4 @@ async def _notify_all_products_deleted(count: int):
             "count": count,
             "message": f"All {count} products have been deleted"
         }
-    })
\ No newline at end of file
+    })
@@ -0,0 +1,84 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from core.config import settings
+from models.product import DEFAULT_SOURCE
+from service.product_extractor import SELECTORS
+
+DEFAULT_SOURCE_KEY = DEFAULT_SOURCE
+
+
+@dataclass
+class ParserSource:
+    """
+    Описание одного источника: откуда начинать обход, как строить адрес
+    страницы, какими селекторами разбирать карточки и с какой частотой
+    ходить к сайту. selectors дополняют стандартные SELECTORS.
+    """
+    key: str
+    start_url: str
+    base_url: Optional[str] = None
+    page_param: str = "page"
+    selectors: Dict[str, str] = field(default_factory=dict)
+    rate_limit: float = field(default_factory=lambda: settings.PARSER_RATE_LIMIT)
+    concurrency: int = field(default_factory=lambda: settings.PARSER_CONCURRENCY)
+    max_pages: int = 100
+
+    def __post_init__(self):
+        if not self.base_url:
+            parts = urlsplit(self.start_url)
+            self.base_url = f"{parts.scheme}://{parts.netloc}"
+        self.selectors = {**SELECTORS, **self.selectors}
+
+    def page_url(self, page: int) -> str:
+        if page == 1:
+            return self.start_url
+        parts = urlsplit(self.start_url)
+        query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                 if name != self.page_param]
+        query.append((self.page_param, str(page)))
+        return urlunsplit(parts._replace(query=urlencode(query, safe=",")))
+
+    @property
+    def hash_markers(self) -> tuple:
+        """Маркеры начала и конца области карточек для хэша содержимого страницы."""
+        return _css_marker(self.selectors['card']), _css_marker(self.selectors['pagination'])
+
+
+def _css_marker(css: str) -> str:
+    match = re.match(r'[.#]?([\w-]+)', css.strip())
+    return match.group(1) if match else css
+
+
+_sources: Dict[str, ParserSource] = {}
+
+
+def register_source(source: ParserSource):
+    _sources[source.key] = source
+
+
+def get_source(key: str) -> ParserSource:
+    _load_sources()
+    try:
+        return _sources[key]
+    except KeyError:
+        raise ValueError(f"Unknown parser source: {key}")
+
+
+def get_sources() -> List[ParserSource]:
+    _load_sources()
+    return list(_sources.values())
+
+
+def _load_sources():
+    if _sources:
+        return
+
+    register_source(ParserSource(key=DEFAULT_SOURCE_KEY, start_url=settings.PARSER_URL))
+    for source_config in settings.PARSER_SOURCES:
+        # Одна ошибка в PARSER_SOURCES не должна останавливать обход остальных источников
+        try:
+            register_source(ParserSource(**source_config))
+        except (TypeError, ValueError) as e:
+            print(f"Skipping invalid parser source {source_config!r}: {e}")
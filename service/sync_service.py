@@ -0,0 +1,203 @@
+import asyncio
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Dict, List
+from sqlalchemy import select, func, or_, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.database import AsyncSessionLocal
+from models.product import Product, DEFAULT_SOURCE, normalize_url
+from service.price_history_service import record_prices
+from service.product_index import product_index, IndexEntry
+from core.config import settings
+from core.metrics import DB_SYNC_SECONDS, DB_POOL_CHECKOUT_SECONDS, SYNC_PRODUCTS_TOTAL
+
+
+SYNC_COLUMNS = ("name", "price", "old_price", "url", "image_url", "availability", "source")
+
+
+@dataclass
+class SyncResult:
+    created: List[dict] = field(default_factory=list)
+    updated: List[dict] = field(default_factory=list)
+    unchanged: List[dict] = field(default_factory=list)
+    # Записанные значения попадают в product_index только после коммита
+    index_updates: List[tuple] = field(default_factory=list, repr=False)
+
+    @property
+    def created_count(self) -> int:
+        return len(self.created)
+
+    @property
+    def updated_count(self) -> int:
+        return len(self.updated)
+
+    @property
+    def unchanged_count(self) -> int:
+        return len(self.unchanged)
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _is_unchanged(current: IndexEntry, product_data: dict) -> bool:
+    return current.price == product_data['price'] and current.availability == product_data['availability']
+
+
+async def sync_products(session: AsyncSession, products_data: List[dict]) -> SyncResult:
+    """
+    Синхронизирует распарсенные товары с БД пачками.
+
+    Неизменившиеся товары (цена и наличие совпадают) отсеиваются по
+    product_index без обращения к БД; для промахов индекса выполняется один
+    SELECT на чанк. Новые и изменившиеся товары записываются одним
+    INSERT ... ON CONFLICT (url) DO UPDATE на чанк: параллельные синхронизации
+    не создают дубликатов, а строка, которую уже обновил кто-то другой, не
+    вернётся из RETURNING и будет учтена как неизменившаяся.
+    Точки истории цен пишутся только для новых товаров и изменений цены.
+    Коммит остаётся на вызывающей стороне.
+    """
+    result = SyncResult()
+    if not products_data:
+        return result
+
+    chunk_size = max(1, settings.DB_SYNC_CHUNK_SIZE)
+
+    # Один URL — одна строка, последняя версия со страницы выигрывает
+    by_url: Dict[str, dict] = {}
+    for product_data in products_data:
+        url = normalize_url(product_data.get('url'))
+        if url is None:
+            continue
+        by_url[url] = {
+            **product_data,
+            'url': url,
+            'availability': product_data.get('availability', 'available'),
+            'source': product_data.get('source') or DEFAULT_SOURCE
+        }
+
+    known: Dict[str, IndexEntry] = {}
+    missing = []
+    for url in by_url:
+        entry = product_index.get(url)
+        if entry is None:
+            missing.append(url)
+        else:
+            known[url] = entry
+
+    for chunk in _chunks(missing, chunk_size):
+        rows = await session.execute(
+            select(Product.id, Product.url, Product.price, Product.availability)
+            .where(Product.url.in_(chunk))
+        )
+        for row in rows:
+            known[row.url] = IndexEntry(row.id, row.price, row.availability)
+            product_index.put(row.url, row.id, row.price, row.availability)
+
+    to_write = []
+    for url, product_data in by_url.items():
+        current = known.get(url)
+        if current is not None and _is_unchanged(current, product_data):
+            result.unchanged.append({
+                "id": current.id, "name": product_data['name'],
+                "price": current.price, "source": product_data['source']
+            })
+        else:
+            to_write.append(product_data)
+
+    history = []
+    for chunk in _chunks(to_write, chunk_size):
+        stmt = pg_insert(Product).values([
+            {column: product_data.get(column) for column in SYNC_COLUMNS} for product_data in chunk
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Product.url],
+            set_={
+                "price": stmt.excluded.price,
+                "old_price": func.coalesce(stmt.excluded.old_price, Product.old_price),
+                "availability": stmt.excluded.availability,
+                "updated_at": func.now(),
+            },
+            where=or_(
+                Product.price.is_distinct_from(stmt.excluded.price),
+                Product.availability.is_distinct_from(stmt.excluded.availability)
+            )
+        ).returning(
+            Product.id, Product.url, Product.name, Product.price, Product.availability, Product.source,
+            literal_column("xmax = 0").label("inserted")
+        )
+
+        written = set()
+        for row in await session.execute(stmt):
+            written.add(row.url)
+            result.index_updates.append((row.url, row.id, row.price, row.availability))
+            if row.inserted:
+                result.created.append({"id": row.id, "name": row.name, "price": row.price, "source": row.source})
+                history.append({"product_id": row.id, "price": row.price})
+                continue
+
+            current = known.get(row.url)
+            old_price = current.price if current is not None else row.price
+            result.updated.append({
+                "id": row.id,
+                "name": row.name,
+                "price": row.price,
+                "old_price": old_price,
+                "source": row.source
+            })
+            if old_price != row.price:
+                history.append({"product_id": row.id, "price": row.price})
+
+        # Строку уже привёл к тем же значениям параллельный writer
+        for product_data in chunk:
+            if product_data['url'] not in written:
+                current = known.get(product_data['url'])
+                result.unchanged.append({
+                    "id": current.id if current is not None else None,
+                    "name": product_data['name'],
+                    "price": product_data['price'],
+                    "source": product_data['source']
+                })
+
+    for chunk in _chunks(history, chunk_size):
+        await record_prices(session, chunk)
+
+    return result
+
+
+_page_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+async def sync_page(page_url: str, products_data: List[dict]) -> SyncResult:
+    """
+    Синхронизация одной страницы в своей транзакции.
+    Фоновый обход и ручные задачи могут одновременно дойти до одной страницы:
+    блокировка по URL не даёт им писать одни и те же строки параллельно.
+    """
+    lock = _page_locks.get(page_url)
+    if lock is None:
+        lock = _page_locks[page_url] = asyncio.Lock()
+
+    async with lock:
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as session:
+            await session.connection()
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+            result = await sync_products(session, products_data)
+            await session.commit()
+        DB_SYNC_SECONDS.observe(time.perf_counter() - started)
+
+    SYNC_PRODUCTS_TOTAL.labels("created").inc(result.created_count)
+    SYNC_PRODUCTS_TOTAL.labels("updated").inc(result.updated_count)
+    SYNC_PRODUCTS_TOTAL.labels("unchanged").inc(result.unchanged_count)
+    apply_index_updates(result)
+    return result
+
+
+def apply_index_updates(sync_result: SyncResult):
+    """Вызывать после коммита транзакции, в которой выполнялся sync_products."""
+    for url, product_id, price, availability in sync_result.index_updates:
+        product_index.put(url, product_id, price, availability)
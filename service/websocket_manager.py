@@ -1,44 +1,585 @@
-from typing import Dict
+import asyncio
+import json
+import time
+import uuid
+import zlib
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple, Union
+import msgpack
 from fastapi import WebSocket
+from core.config import settings
+from core.metrics import (
+    WS_CLIENTS, WS_QUEUE_DEPTH, WS_QUEUE_DEPTH_MAX, WS_SEND_SECONDS, WS_BYTES_SENT_TOTAL,
+    WS_FRAMES_DROPPED_TOTAL
+)
+from service.nats_client import nats_client
+
+SLOW_CLIENT_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+# json — текстовые кадры, msgpack — бинарные кадры MessagePack с той же структурой
+ENCODINGS = ("json", "msgpack")
+
+WS_FANOUT_SUBJECT = "ws.fanout"
+# Идентификатор процесса: по нему реплика узнаёт и пропускает собственные сообщения.
+# Он же — epoch последовательности seq: номера событий имеют смысл только в его пределах
+NODE_ID = uuid.uuid4().hex
+
+# Сообщения о товарах: тип -> (вид события, ключ списка товаров в data или None для одного товара)
+ITEM_MESSAGES = {
+    "product_created": (("created", None),),
+    "product_updated": (("updated", None),),
+    "product_deleted": (("deleted", None),),
+    "products_batch": (("created", "created"), ("updated", "updated"), ("deleted", "deleted")),
+    "products_batch_created": (("created", "products"),),
+    "products_batch_updated": (("updated", "products"),),
+}
+# Сообщения без списка товаров, которые подписка на вид события тоже должна получать
+TYPE_EVENT_KINDS = {
+    "all_products_deleted": "deleted",
+}
+
+
+@dataclass
+class Subscription:
+    """
+    Фильтр клиента. Внутри одного измерения темы объединяются через ИЛИ,
+    между измерениями — через И; пустое измерение не ограничивает.
+    """
+    product_ids: Set[int] = field(default_factory=set)
+    events: Set[str] = field(default_factory=set)
+    sources: Set[str] = field(default_factory=set)
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+
+    def topics(self) -> List[str]:
+        topics = [f"product:{product_id}" for product_id in self.product_ids] or ["product:*"]
+        topics += [f"source:{source}" for source in self.sources] or ["source:*"]
+        return topics
+
+    def accepts_type(self, message_type: str) -> bool:
+        if not self.events or message_type in self.events:
+            return True
+        return TYPE_EVENT_KINDS.get(message_type) in self.events
+
+    def accepts_item(self, kind: str, item: dict) -> bool:
+        if self.events and kind not in self.events:
+            return False
+        if self.product_ids and item.get("id") not in self.product_ids:
+            return False
+        if self.sources and item.get("source") not in self.sources:
+            return False
+        # У удалённого товара цены нет: диапазон цен к удалениям не применяется
+        if kind == "deleted":
+            return True
+        price = item.get("price")
+        if self.min_price is not None and (price is None or price < self.min_price):
+            return False
+        if self.max_price is not None and (price is None or price > self.max_price):
+            return False
+        return True
+
+    def to_dict(self) -> dict:
+        return {
+            "product_ids": sorted(self.product_ids),
+            "events": sorted(self.events),
+            "sources": sorted(self.sources),
+            "min_price": self.min_price,
+            "max_price": self.max_price
+        }
+
+
+Payload = Union[str, bytes]
+QueueItem = Tuple[Payload, int]
+
+
+class ClientConnection:
+    def __init__(self, client_id: str, websocket: WebSocket, encoding: str = "json"):
+        self.client_id = client_id
+        self.websocket = websocket
+        self.encoding = encoding
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_SEND_QUEUE_SIZE)
+        self.writer_task: Optional[asyncio.Task] = None
+        self.dropped = 0
+        # Пока идёт resync, новые события откладываются, чтобы не обогнать догоняющие
+        self.held: Optional[List[QueueItem]] = None
+
+
+def _with_seq(text: str, seq: int) -> str:
+    """Добавляет seq в уже сериализованный JSON-объект без повторной сериализации."""
+    return f'{text[:-1]},"seq":{seq}}}'
+
+
+def _dumps(message: dict) -> str:
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+
+def _packb(message: dict) -> bytes:
+    return msgpack.packb(message, use_bin_type=True)
+
+
+def _size(payload: Payload) -> int:
+    return len(payload) if isinstance(payload, bytes) else len(payload.encode("utf-8"))
+
+
+class Frame:
+    """
+    Событие, готовое к отправке. Каждая кодировка сериализуется не больше
+    одного раза, сколько бы клиентов ни получали кадр; вместе с кадром
+    запоминается его размер в байтах для статистики отправки.
+    """
+    __slots__ = ("message", "seq", "_payloads")
+
+    def __init__(self, message: dict, seq: Optional[int] = None, text: Optional[str] = None):
+        self.message = message
+        self.seq = seq
+        self._payloads: Dict[str, QueueItem] = {}
+        if text is not None:
+            self._payloads["json"] = (text, _size(text))
+
+    def body(self) -> dict:
+        return self.message if self.seq is None else {**self.message, "seq": self.seq}
+
+    def payload(self, encoding: str) -> QueueItem:
+        cached = self._payloads.get(encoding)
+        if cached is None:
+            if encoding == "msgpack":
+                data: Payload = _packb(self.body())
+            else:
+                data = _dumps(self.message)
+                if self.seq is not None:
+                    data = _with_seq(data, self.seq)
+            cached = self._payloads[encoding] = (data, _size(data))
+        return cached
 
 
 class ConnectionManager:
+    """
+    broadcast сериализует сообщение один раз и кладёт готовый текст
+    в ограниченную очередь каждого клиента; отправкой занимается
+    отдельная writer-задача соединения, поэтому медленный клиент
+    не задерживает вызывающий код.
+
+    Между репликами сообщения расходятся через NATS (ws.fanout): реплика
+    доставляет сообщение своим клиентам сама и один раз публикует его с NODE_ID,
+    остальные реплики доставляют его своим клиентам, а своё эхо отбрасывают.
+
+    Клиенты без подписки получают все сообщения. Для подписанных ведётся
+    индекс тема -> клиенты (product:<id>, source:<key>, * — без ограничения),
+    по нему выбираются кандидаты, а из пачек вырезаются только подходящие товары.
+    Каждый различающийся вариант сообщения сериализуется один раз.
+
+    Каждое разосланное событие получает номер seq (растёт монотонно в пределах
+    epoch = NODE_ID) и попадает в кольцевой буфер на WS_REPLAY_BUFFER_SIZE
+    событий. Переподключившийся клиент присылает last_seq и epoch: если
+    пропущенное ещё в буфере, он получает одним кадром только его, иначе —
+    сжатый gzip снимок каталога (бинарный кадр) и события после снимка
+    (события, разосланные во время построения снимка, могут прийти повторно).
+    Снимок кэшируется на WS_SNAPSHOT_CACHE_SECONDS, чтобы волна переподключений
+    после деплоя не превращалась в волну полных выгрузок.
+
+    Клиент выбирает кодировку при подключении (ENCODINGS): JSON-текст или
+    бинарный MessagePack. Кадр события сериализуется в кодировку один раз
+    на всех её получателей; отправленные байты считаются по кодировкам
+    (до сжатия permessage-deflate).
+    """
+
     def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+        self.active_connections: Dict[str, ClientConnection] = {}
+        self._remote_listeners: List[Callable[[dict], None]] = []
+        self._subscriptions: Dict[str, Subscription] = {}
+        self._topic_index: Dict[str, Set[str]] = defaultdict(set)
+        self._seq = 0
+        self._history: Deque[Frame] = deque(maxlen=settings.WS_REPLAY_BUFFER_SIZE)
+        self._snapshot_provider: Optional[Callable[[Optional[Subscription]], Awaitable[bytes]]] = None
+        self._snapshot_cache: Dict[Tuple[str, str], Tuple[float, int, bytes]] = {}
+        self._bytes_sent: Dict[str, int] = dict.fromkeys(ENCODINGS, 0)
+        self._frames_sent: Dict[str, int] = dict.fromkeys(ENCODINGS, 0)
 
-    async def connect(self, websocket: WebSocket, client_id: str):
+    async def connect(self, websocket: WebSocket, client_id: str, encoding: str = "json"):
         await websocket.accept()
         if client_id in self.active_connections:
-            old_ws = self.active_connections[client_id]
+            old_connection = self.active_connections.pop(client_id)
+            self._stop_writer(old_connection)
+            self._set_subscription(client_id, None)
             try:
-                await old_ws.close(code=1000, reason="New connection from same client")
+                await old_connection.websocket.close(code=1000, reason="New connection from same client")
             except:
                 pass
 
-        self.active_connections[client_id] = websocket
+        connection = ClientConnection(client_id, websocket, encoding)
+        connection.writer_task = asyncio.create_task(self._writer(connection))
+        self.active_connections[client_id] = connection
 
-    def disconnect(self, client_id: str):
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
+    def disconnect(self, client_id: str, websocket: Optional[WebSocket] = None):
+        connection = self.active_connections.get(client_id)
+        if connection is None:
+            return
+        # Старое соединение, уже заменённое новым с тем же client_id, не трогает новое
+        if websocket is not None and connection.websocket is not websocket:
+            return
+
+        del self.active_connections[client_id]
+        self._stop_writer(connection)
+        self._set_subscription(client_id, None)
+
+    def subscribe(
+            self, client_id: str, product_ids=None, events=None, sources=None,
+            min_price: Optional[float] = None, max_price: Optional[float] = None
+    ) -> dict:
+        current = self._subscriptions.get(client_id) or Subscription()
+        subscription = Subscription(
+            product_ids=current.product_ids | set(product_ids or ()),
+            events=current.events | set(events or ()),
+            sources=current.sources | set(sources or ()),
+            min_price=min_price if min_price is not None else current.min_price,
+            max_price=max_price if max_price is not None else current.max_price
+        )
+        self._set_subscription(client_id, subscription)
+        return subscription.to_dict()
+
+    def unsubscribe(
+            self, client_id: str, product_ids=None, events=None, sources=None,
+            min_price: Optional[float] = None, max_price: Optional[float] = None
+    ) -> dict:
+        current = self._subscriptions.get(client_id)
+        if current is None:
+            return Subscription().to_dict()
+        if not any((product_ids, events, sources, min_price is not None, max_price is not None)):
+            self._set_subscription(client_id, None)
+            return Subscription().to_dict()
+
+        subscription = Subscription(
+            product_ids=current.product_ids - set(product_ids or ()),
+            events=current.events - set(events or ()),
+            sources=current.sources - set(sources or ()),
+            min_price=None if min_price is not None else current.min_price,
+            max_price=None if max_price is not None else current.max_price
+        )
+        self._set_subscription(client_id, subscription)
+        return subscription.to_dict()
+
+    def _set_subscription(self, client_id: str, subscription: Optional[Subscription]):
+        old = self._subscriptions.pop(client_id, None)
+        if old is not None:
+            for topic in old.topics():
+                clients = self._topic_index[topic]
+                clients.discard(client_id)
+                if not clients:
+                    del self._topic_index[topic]
+
+        if subscription is None or subscription == Subscription():
+            return
+        self._subscriptions[client_id] = subscription
+        for topic in subscription.topics():
+            self._topic_index[topic].add(client_id)
 
     async def broadcast(self, message: dict):
-        if not self.active_connections:
+        """Доставляет сообщение клиентам всех реплик."""
+        text = _dumps(message)
+        self._broadcast_local(message, text)
+
+        # Конверт собирается из готового текста, сообщение не сериализуется второй раз
+        envelope = f'{{"origin":"{NODE_ID}","message":{text}}}'
+        await nats_client.publish_raw(WS_FANOUT_SUBJECT, envelope.encode("utf-8"))
+
+    def _broadcast_local(self, message: dict, text: str):
+        self._seq += 1
+        seq = self._seq
+        frame = Frame(message, seq, _with_seq(text, seq))
+        self._history.append(frame)
+
+        subscriptions = self._subscriptions
+        for client_id, connection in list(self.active_connections.items()):
+            if client_id not in subscriptions:
+                self._deliver(connection, frame)
+        if not subscriptions:
             return
 
-        disconnected = []
-        for client_id, connection in self.active_connections.items():
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"Error sending to client {client_id}: {e}")
-                disconnected.append(client_id)
+        message_type = message.get("type")
+        layout = ITEM_MESSAGES.get(message_type)
+        if layout is None:
+            for client_id, subscription in list(subscriptions.items()):
+                connection = self.active_connections.get(client_id)
+                if connection is not None and subscription.accepts_type(message_type):
+                    self._deliver(connection, frame)
+            return
 
-        for client_id in disconnected:
-            self.disconnect(client_id)
+        item_lists = self._item_lists(message, layout)
 
-    def get_client_count(self) -> int:
-        return len(self.active_connections)
+        # Клиенты с одинаковым набором подходящих товаров получают один и тот же кадр
+        groups: Dict[Tuple, List[ClientConnection]] = defaultdict(list)
+        for client_id in self._candidates(item_lists):
+            connection = self.active_connections.get(client_id)
+            subscription = subscriptions.get(client_id)
+            if connection is None or subscription is None:
+                continue
+            mask = self._mask(subscription, item_lists)
+            if any(mask):
+                groups[mask].append(connection)
 
+        full_mask = tuple(tuple(range(len(items))) for _, _, items in item_lists)
+        for mask, connections in groups.items():
+            group_frame = frame
+            if mask != full_mask:
+                group_frame = Frame(self._subset_message(message, item_lists, mask), seq)
+            for connection in connections:
+                self._deliver(connection, group_frame)
 
-manager = ConnectionManager()
+    def _frame_for(self, subscription: Optional[Subscription], frame: Frame) -> Optional[Frame]:
+        """Кадр события из буфера в том виде, в каком его получил бы клиент с такой подпиской."""
+        if subscription is None:
+            return frame
+
+        message = frame.message
+        message_type = message.get("type")
+        layout = ITEM_MESSAGES.get(message_type)
+        if layout is None:
+            return frame if subscription.accepts_type(message_type) else None
+
+        item_lists = self._item_lists(message, layout)
+        mask = self._mask(subscription, item_lists)
+        if not any(mask):
+            return None
+        if mask == tuple(tuple(range(len(items))) for _, _, items in item_lists):
+            return frame
+        return Frame(self._subset_message(message, item_lists, mask), frame.seq)
+
+    @staticmethod
+    def _item_lists(message: dict, layout) -> list:
+        data = message.get("data") or {}
+        return [
+            (kind, key, [data] if key is None else data.get(key) or [])
+            for kind, key in layout
+        ]
+
+    @staticmethod
+    def _mask(subscription: Subscription, item_lists) -> Tuple:
+        return tuple(
+            tuple(index for index, item in enumerate(items) if subscription.accepts_item(kind, item))
+            for kind, _, items in item_lists
+        )
+
+    def _candidates(self, item_lists) -> Set[str]:
+        product_topics = {"product:*"}
+        source_topics = {"source:*"}
+        for _, _, items in item_lists:
+            for item in items:
+                product_topics.add(f"product:{item.get('id')}")
+                source_topics.add(f"source:{item.get('source')}")
+
+        index = self._topic_index
+        by_product = set().union(*(index.get(topic, ()) for topic in product_topics))
+        if not by_product:
+            return by_product
+        return by_product & set().union(*(index.get(topic, ()) for topic in source_topics))
+
+    @staticmethod
+    def _subset_message(message: dict, item_lists, mask) -> dict:
+        data = dict(message["data"])
+        for (_, key, items), indexes in zip(item_lists, mask):
+            data[key] = [items[index] for index in indexes]
+        if "count" in data:
+            data["count"] = sum(len(indexes) for indexes in mask)
+        return {**message, "data": data}
+
+    async def start_fanout(self):
+        await nats_client.subscribe(WS_FANOUT_SUBJECT, self._on_fanout)
+
+    def add_remote_listener(self, callback: Callable[[dict], None]):
+        """callback вызывается для каждого сообщения, пришедшего с другой реплики."""
+        self._remote_listeners.append(callback)
+
+    async def _on_fanout(self, msg):
+        try:
+            envelope = json.loads(msg.data.decode())
+            if envelope.get("origin") == NODE_ID:
+                return
+
+            message = envelope["message"]
+            self._broadcast_local(message, _dumps(message))
+            for callback in self._remote_listeners:
+                callback(message)
+        except Exception as e:
+            print(f"Error delivering fan-out message: {e}")
+
+    async def send_personal(self, client_id: str, message: dict):
+        connection = self.active_connections.get(client_id)
+        if connection is None:
+            return
+
+        self._enqueue(connection, *Frame(message).payload(connection.encoding))
+
+    def set_snapshot_provider(self, provider: Callable[[Optional[Subscription]], Awaitable[bytes]]):
+        """provider возвращает JSON-массив товаров (bytes), подходящих под подписку."""
+        self._snapshot_provider = provider
+
+    async def resync(self, client_id: str, last_seq: Optional[int], epoch: Optional[str]):
+        """
+        Досылает клиенту пропущенное после last_seq: из буфера, если он
+        покрывает разрыв в том же epoch, иначе снимком и событиями после него.
+        """
+        connection = self.active_connections.get(client_id)
+        if connection is None:
+            return
+
+        oldest_seq = self._history[0].seq if self._history else self._seq + 1
+        if epoch == NODE_ID and last_seq is not None and oldest_seq <= last_seq + 1 <= self._seq + 1:
+            self._enqueue(connection, self._replay_frame(connection, "delta", last_seq, self._seq))
+            return
+
+        if self._snapshot_provider is None:
+            self._enqueue(connection, self._replay_frame(connection, "reset", self._seq, self._seq))
+            return
+
+        connection.held = []
+        try:
+            snapshot_seq, snapshot = await self._snapshot(self._subscriptions.get(client_id), connection.encoding)
+        except Exception as e:
+            print(f"Error building snapshot for client {client_id}: {e}")
+            held, connection.held = connection.held, None
+            for payload, size in held:
+                self._enqueue(connection, payload, size)
+            return
+
+        # Отложенные события уже лежат в буфере и войдут в кадр после снимка
+        connection.held = None
+        if self.active_connections.get(client_id) is not connection:
+            return
+        self._enqueue(connection, snapshot)
+        self._enqueue(connection, self._replay_frame(connection, "delta", snapshot_seq, self._seq))
+
+    def _replay_frame(self, connection: ClientConnection, mode: str, from_seq: int, to_seq: int) -> Payload:
+        subscription = self._subscriptions.get(connection.client_id)
+        frames = []
+        if mode == "delta":
+            for frame in self._history:
+                if from_seq < frame.seq <= to_seq:
+                    frame = self._frame_for(subscription, frame)
+                    if frame is not None:
+                        frames.append(frame)
+
+        header = {"type": "resync", "mode": mode, "epoch": NODE_ID, "from_seq": from_seq, "seq": to_seq}
+        if connection.encoding == "msgpack":
+            return _packb({**header, "events": [frame.body() for frame in frames]})
+        events = ",".join(frame.payload("json")[0] for frame in frames)
+        return f'{_dumps(header)[:-1]},"events":[{events}]}}'
+
+    async def _snapshot(self, subscription: Optional[Subscription], encoding: str = "json") -> Tuple[int, bytes]:
+        """
+        Для json — gzip от JSON (бинарный кадр, клиент распаковывает сам),
+        для msgpack — обычный кадр MessagePack: его сжимает permessage-deflate.
+        """
+        key = (encoding, _dumps(subscription.to_dict()) if subscription else "")
+        cached = self._snapshot_cache.get(key)
+        now = time.monotonic()
+        if cached is not None and now - cached[0] < settings.WS_SNAPSHOT_CACHE_SECONDS:
+            return cached[1], cached[2]
+
+        # seq читается до запроса: событие с меньшим номером уже закоммичено и есть
+        # в снимке. Событие, разосланное во время запроса, может попасть и в снимок,
+        # и в delta после него — повтор безопасен, кадр несёт полное состояние товара
+        seq = self._seq
+        products = await self._snapshot_provider(subscription)
+        header = {"type": "snapshot", "epoch": NODE_ID, "seq": seq}
+        if encoding == "msgpack":
+            payload = _packb({**header, "data": json.loads(products)})
+        else:
+            compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+            payload = compressor.compress(
+                _dumps(header).encode("utf-8")[:-1] + b',"data":' + products + b'}'
+            ) + compressor.flush()
+
+        self._snapshot_cache = {
+            cache_key: entry for cache_key, entry in self._snapshot_cache.items()
+            if now - entry[0] < settings.WS_SNAPSHOT_CACHE_SECONDS
+        }
+        self._snapshot_cache[key] = (now, seq, payload)
+        return seq, payload
+
+    def get_client_count(self, encoding: Optional[str] = None) -> int:
+        if encoding is None:
+            return len(self.active_connections)
+        return sum(1 for connection in self.active_connections.values() if connection.encoding == encoding)
 
+    def queue_depths(self) -> List[int]:
+        return [connection.queue.qsize() for connection in self.active_connections.values()]
+
+    def stats(self) -> Dict[str, Any]:
+        clients = dict.fromkeys(ENCODINGS, 0)
+        for connection in self.active_connections.values():
+            clients[connection.encoding] += 1
+        return {
+            "clients": clients,
+            "bytes_sent": dict(self._bytes_sent),
+            "frames_sent": dict(self._frames_sent),
+            "dropped": sum(connection.dropped for connection in self.active_connections.values()),
+            "seq": self._seq,
+            "epoch": NODE_ID
+        }
+
+    def _deliver(self, connection: ClientConnection, frame: Frame):
+        item = frame.payload(connection.encoding)
+        if connection.held is not None:
+            connection.held.append(item)
+        else:
+            self._enqueue(connection, *item)
+
+    def _enqueue(self, connection: ClientConnection, payload: Payload, size: Optional[int] = None):
+        item = (payload, _size(payload) if size is None else size)
+        try:
+            connection.queue.put_nowait(item)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        connection.dropped += 1
+        WS_FRAMES_DROPPED_TOTAL.inc()
+        policy = settings.WS_SLOW_CLIENT_POLICY
+        if policy == "drop_oldest":
+            connection.queue.get_nowait()
+            connection.queue.put_nowait(item)
+        elif policy == "disconnect":
+            print(f"Client {connection.client_id} is too slow, disconnecting")
+            self.disconnect(connection.client_id, connection.websocket)
+            asyncio.create_task(self._close(connection.websocket, 1013, "Client is too slow"))
+        # drop_newest: новое сообщение просто не попадает в очередь
+
+    async def _writer(self, connection: ClientConnection):
+        send_seconds = WS_SEND_SECONDS.labels(connection.encoding)
+        bytes_sent = WS_BYTES_SENT_TOTAL.labels(connection.encoding)
+        try:
+            while True:
+                payload, size = await connection.queue.get()
+                started = time.perf_counter()
+                if isinstance(payload, bytes):
+                    await connection.websocket.send_bytes(payload)
+                else:
+                    await connection.websocket.send_text(payload)
+                send_seconds.observe(time.perf_counter() - started)
+                bytes_sent.inc(size)
+                self._bytes_sent[connection.encoding] += size
+                self._frames_sent[connection.encoding] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error sending to client {connection.client_id}: {e}")
+            self.disconnect(connection.client_id, connection.websocket)
+
+    @staticmethod
+    def _stop_writer(connection: ClientConnection):
+        if connection.writer_task and not connection.writer_task.done():
+            connection.writer_task.cancel()
+
+    @staticmethod
+    async def _close(websocket: WebSocket, code: int, reason: str):
+        try:
+            await websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+
+manager = ConnectionManager()
+for _encoding in ENCODINGS:
+    WS_CLIENTS.labels(_encoding).set_function(lambda encoding=_encoding: manager.get_client_count(encoding))
+WS_QUEUE_DEPTH.set_function(lambda: sum(manager.queue_depths()))
+WS_QUEUE_DEPTH_MAX.set_function(lambda: max(manager.queue_depths(), default=0))